@@ -0,0 +1,219 @@
+"""Resolução em lote de instâncias de Bimaru.
+
+Resolve todas as instâncias de uma pasta (ou de um padrão glob) num conjunto
+de processos e escreve no stdout uma linha JSON por instância, pela ordem em
+que terminam. Cada solução é verificada com validator.py e, quando existe o
+ficheiro .out correspondente, também comparada com ele. Com --cache, as
+instâncias já resolvidas (ou transpostas e espelhadas de outras) são lidas
+de uma bimaru.SolutionCache partilhada por todos os processos.
+
+Uso:
+    $ python3 batch.py instances/ --timeout 60
+    $ python3 batch.py 'instances/instance0*.txt' --search trail --backend bitboard
+    $ python3 batch.py instances/ --cache solutions.db
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import bimaru
+import validator
+
+
+# Segundos a mais dados ao SIGALRM de time_limit: as procuras que respeitam o tempo limite do
+# BimaruSolver param antes e devolvem o progresso parcial; o alarme só apanha as restantes (dlx, sat)
+TIMEOUT_GRACE = 1.0
+
+
+# Procuras que podem correr dentro de um processo do pool: a 'parallel' cria processos próprios, o que
+# multiprocessing não permite a partir de um processo daemon como os do Pool
+BATCH_SEARCHES = sorted(name for name in bimaru.SEARCHES if name != 'parallel')
+
+
+class SolveTimeout(Exception):
+    """Lançada quando uma instância excede o tempo limite."""
+
+
+def _raise_timeout(signum, frame):
+    raise SolveTimeout()
+
+
+@contextmanager
+def time_limit(seconds):
+    """Lança SolveTimeout dentro do bloco se este demorar mais do que
+    'seconds' segundos. Usa SIGALRM, pelo que só funciona na thread
+    principal e em sistemas que o suportem; sem limite ou sem SIGALRM o
+    bloco corre até ao fim."""
+    if not seconds or not hasattr(signal, 'setitimer'):
+        yield
+        return
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def find_instances(target):
+    """Devolve as instâncias de 'target', que pode ser uma pasta (todos os
+    ficheiros .txt) ou um padrão glob."""
+    if os.path.isdir(target):
+        target = os.path.join(target, '*.txt')
+    return sorted(glob.glob(target))
+
+
+def expected_solution(path):
+    """Devolve a solução guardada no .out da instância, se existir."""
+    out_path = os.path.splitext(path)[0] + '.out'
+    if not os.path.exists(out_path):
+        return None
+    with open(out_path) as out:
+        return out.read().strip()
+
+
+def solve_instance(job):
+    """Resolve uma instância e devolve o dicionário a escrever em JSON.
+    Corre dentro de um processo do pool."""
+    (path, backend, search, propagation, heuristic, branching, transpositions, symmetry, deduce, timeout,
+     max_nodes, cache_path, cache_size) = job
+    result = {'instance': path, 'backend': backend, 'propagation': propagation, 'heuristic': heuristic,
+              'branching': branching, 'symmetry': symmetry, 'deduce': deduce}
+    start = time.perf_counter()
+    cache = bimaru.SolutionCache(cache_path, cache_size) if cache_path else None
+    solver = bimaru.BimaruSolver(backend, search, propagation, heuristic, branching, transpositions,
+                                 symmetry, cache=cache, max_nodes=max_nodes, time_limit=timeout,
+                                 deduce=deduce)
+    try:
+        with time_limit(timeout and timeout + TIMEOUT_GRACE), open(path) as instance:
+            board = solver.solve(instance)
+        result['status'] = solver.status
+        result['solution'] = board.solution_string().split('\n') if board is not None else None
+        if solver.status in ('node-limit', 'timeout'):
+            report = solver.report()
+            result['partial'] = {name: report[name] for name in ('ships_placed', 'ships_total', 'deepest')
+                                 if name in report}
+        if board is not None:
+            rows, columns, hints = validator.instance_arrays([solver.board])
+            grid = validator.solution_array([board.solution_string()])
+            result['valid'] = bool(validator.valid_solutions(grid, rows, columns, solver.board.ships, hints)[0])
+    except SolveTimeout:
+        result['status'] = 'timeout'
+    except Exception as error:
+        result['status'] = 'error'
+        result['error'] = '{}: {}'.format(type(error).__name__, error)
+    finally:
+        if cache is not None:
+            cache.close()
+    result['time'] = time.perf_counter() - start
+    result['search'] = solver.search_used
+    result['cached'] = solver.search_used == 'cache'
+    if solver.deduction is not None:
+        result['deduction'] = solver.deduction
+    result['nodes'] = solver.problem.succs if solver.problem is not None else 0
+    result['generated'] = solver.problem.states if solver.problem is not None else 0
+    if solver.problem is not None:
+        problem = solver.problem.problem
+        result['propagation_steps'] = {'total': problem.propagation_steps, 'max': problem.max_propagation_steps,
+                                       'mean': problem.propagation_steps / max(problem.propagated_actions, 1)}
+    else:
+        result['propagation_steps'] = {'total': 0, 'max': 0, 'mean': 0}
+    factors = solver.problem.problem.branching_factors if solver.problem is not None else {}
+    expanded = sum(factors.values())
+    result['branching_factor'] = {'mean': sum(k * n for k, n in factors.items()) / expanded if expanded else 0,
+                                  'max': max(factors, default=0)}
+    table = solver.problem.problem.table if solver.problem is not None else None
+    if table is not None:
+        result['transpositions'] = {'size': table.size, 'lookups': table.lookups, 'hits': table.hits,
+                                    'hit_rate': table.hit_rate()}
+    expected = expected_solution(path)
+    if expected is None:
+        result['matches_out'] = None
+    else:
+        result['matches_out'] = result.get('solution') is not None and '\n'.join(result['solution']) == expected
+    return result
+
+
+def run_batch(paths, backend='list', search=None, propagation='rescan', heuristic='legacy', branching='scan',
+              transpositions=0, symmetry=False, timeout=None, workers=None, output=sys.stdout, cache=None,
+              cache_size=bimaru.SOLUTION_CACHE_SIZE, max_nodes=None, deduce=False):
+    """Resolve 'paths' num pool de 'workers' processos (por omissão, um por
+    núcleo) e escreve uma linha JSON por instância em 'output'. Devolve a
+    contagem de instâncias por estado. 'cache' é o ficheiro de uma
+    bimaru.SolutionCache com até 'cache_size' soluções. Uma instância que
+    passe de 'timeout' segundos ou 'max_nodes' nós expandidos fica com o
+    estado 'timeout' ou 'node-limit' e o progresso parcial em 'partial'.
+    Com 'deduce', cada resultado tem o relatório de bimaru.deduce_hints."""
+    if search is not None and search not in BATCH_SEARCHES:
+        raise ValueError("Procura {} não disponível em lote; escolher entre {}".format(
+            search, ', '.join(BATCH_SEARCHES)))
+    jobs = [(path, backend, search, propagation, heuristic, branching, transpositions, symmetry, deduce, timeout,
+             max_nodes, cache, cache_size) for path in paths]
+    summary = {}
+    with multiprocessing.Pool(workers or os.cpu_count()) as pool:
+        for result in pool.imap_unordered(solve_instance, jobs):
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+            summary[result['status']] = summary.get(result['status'], 0) + 1
+            if result['matches_out'] is False:
+                summary['mismatch'] = summary.get('mismatch', 0) + 1
+            if result.get('valid') is False:
+                summary['invalid'] = summary.get('invalid', 0) + 1
+            if result['cached']:
+                summary['cached'] = summary.get('cached', 0) + 1
+    return summary
+
+
+def solve_threaded(instances, workers, backend='list', search=None, propagation='rescan'):
+    """Resolve 'instances' (strings com instâncias ou Boards) num pool de
+    'workers' threads, com um BimaruSolver por instância. Devolve os
+    solvers pela ordem de 'instances'.
+
+    Só há ganho com várias threads num Python sem GIL (free-threaded); com
+    GIL serve para verificar que as resoluções não interferem entre si."""
+    def run(instance):
+        solver = bimaru.BimaruSolver(backend, search, propagation)
+        solver.solve(instance)
+        return solver
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run, instances))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resolve em paralelo uma pasta de instâncias de Bimaru.")
+    parser.add_argument("target", help="pasta com ficheiros .txt ou padrão glob")
+    parser.add_argument("--backend", choices=sorted(bimaru.BACKENDS), default="list")
+    parser.add_argument("--search", choices=BATCH_SEARCHES, default=None,
+                        help="algoritmo de procura (por omissão, o mesmo critério que bimaru.py)")
+    parser.add_argument("--propagation", choices=bimaru.PROPAGATIONS, default="rescan")
+    parser.add_argument("--heuristic", choices=sorted(bimaru.HEURISTICS), default="legacy")
+    parser.add_argument("--branching", choices=bimaru.BRANCHINGS, default="scan")
+    parser.add_argument("--transpositions", type=int, default=0, help="entradas da tabela de transposições")
+    parser.add_argument("--symmetry", action="store_true", help="só gera os barcos pela ordem canónica")
+    parser.add_argument("--deduce", action="store_true", help="aplica as pistas forçadas antes de procurar")
+    parser.add_argument("--timeout", type=float, default=None, help="tempo limite por instância, em segundos")
+    parser.add_argument("--max-nodes", type=int, default=None, help="nós expandidos por instância")
+    parser.add_argument("--workers", type=int, default=None, help="número de processos (por omissão, um por núcleo)")
+    parser.add_argument("--cache", metavar="FICHEIRO", help="cache SQLite de soluções partilhada pelos processos")
+    parser.add_argument("--cache-size", type=int, default=bimaru.SOLUTION_CACHE_SIZE,
+                        help="número máximo de soluções na cache")
+    args = parser.parse_args()
+
+    paths = find_instances(args.target)
+    if not paths:
+        sys.exit("Nenhuma instância encontrada em {}".format(args.target))
+    summary = run_batch(paths, args.backend, args.search, args.propagation, args.heuristic, args.branching,
+                        args.transpositions, args.symmetry, args.timeout, args.workers, cache=args.cache,
+                        cache_size=args.cache_size, max_nodes=args.max_nodes,
+                        deduce=args.deduce)
+    print(json.dumps(summary, sort_keys=True), file=sys.stderr)
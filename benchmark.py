@@ -0,0 +1,496 @@
+"""Benchmarks do solver de Bimaru.
+
+Uso:
+    $ python3 benchmark.py backends instance01.txt [outras instâncias...]
+    $ python3 benchmark.py trail 'instances/*.txt'
+    $ python3 benchmark.py threads 'instances/*.txt' --max-workers 8
+    $ python3 benchmark.py scaling --sizes 10 15 20 --count 20
+    $ python3 benchmark.py propagation 'instances/*.txt'
+    $ python3 benchmark.py exact-cover 'instances/*.txt' --limit 1000
+    $ python3 benchmark.py heuristics 'instances/*.txt' --heuristics legacy fleet
+    $ python3 benchmark.py branching 'instances/*.txt'
+    $ python3 benchmark.py transpositions 'instances/*.txt' --searches dfs astar
+    $ python3 benchmark.py symmetry 'instances/*.txt' --limit 100000
+    $ python3 benchmark.py corpus 'corpus/*.txt' --output baseline.json
+    $ python3 benchmark.py corpus 'corpus/*.txt' --baseline baseline.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import batch
+import bimaru
+import generator
+from search import Node
+from utils import print_table
+
+
+def render_solution(node):
+    """Devolve a solução tal como impressa por Board.print_solution."""
+    return None if node is None else node.state.board.solution_string()
+
+
+def solve(board, backend, search=None):
+    problem = bimaru.Bimaru(board, backend)
+    return bimaru.SEARCHES[search or bimaru.default_search(board)](problem)
+
+
+def bench_configs(paths, configs, repeat):
+    """Mede o melhor tempo de 'repeat' resoluções de cada instância com
+    cada configuração (backend, procura) e verifica que todas imprimem a
+    mesma solução que a primeira."""
+    table = []
+    for path in paths:
+        board = bimaru.load_instance(path)
+        row, reference = [path], None
+        for backend, search in configs:
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                node = solve(board, backend, search)
+                best = min(best, time.perf_counter() - start)
+            solution = render_solution(node)
+            if reference is None:
+                reference = solution
+            elif solution != reference:
+                raise AssertionError("{}: a solução com {}/{} difere da de {}/{}".format(
+                    path, backend, search, *configs[0]))
+            row.append(best * 1000)
+        row.append(row[1] / min(row[2:]))
+        table.append(row)
+    header = ['instância'] + ['{}/{} (ms)'.format(backend, search or 'auto') for backend, search in configs]
+    print_table(table, header=header + ['speedup'], numfmt='{:.2f}')
+
+
+def bench_backends(paths, repeat):
+    """Compara as representações de tabuleiro de bimaru.BACKENDS."""
+    backends = sorted(bimaru.BACKENDS, key=lambda name: name != 'list')
+    bench_configs(paths, [(backend, None) for backend in backends], repeat)
+
+
+def bench_trail(paths, repeat):
+    """Compara a DFS com cópia de tabuleiros com a DFS em modo trail."""
+    backends = sorted(bimaru.BACKENDS, key=lambda name: name != 'list')
+    bench_configs(paths, [(backend, search) for backend in backends for search in ('dfs', 'trail')], repeat)
+
+
+def bench_threads(paths, copies, max_workers):
+    """Mede o débito de batch.solve_threaded com 1, 2, 4, ... threads a
+    resolver 'copies' cópias de cada instância. O ganho só aparece num
+    Python free-threaded (sem GIL)."""
+    instances = []
+    for path in paths:
+        with open(path) as instance:
+            instances.append(instance.read())
+    instances *= copies
+    gil_enabled = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print('Python {} ({})'.format(sys.version.split()[0], 'com GIL' if gil_enabled else 'free-threaded'))
+    reference = [solver.node for solver in batch.solve_threaded(instances[:len(paths)], 1)]
+    reference = [render_solution(node) for node in reference] * copies
+    table, base = [], None
+    workers = 1
+    while workers <= max_workers:
+        start = time.perf_counter()
+        solvers = batch.solve_threaded(instances, workers)
+        elapsed = time.perf_counter() - start
+        if [render_solution(solver.node) for solver in solvers] != reference:
+            raise AssertionError("as soluções com {} threads diferem das de 1 thread".format(workers))
+        base = base or elapsed
+        table.append([str(workers), elapsed, len(instances) / elapsed, base / elapsed])
+        workers *= 2
+    print_table(table, header=['threads', 'tempo (s)', 'instâncias/s', 'speedup'], numfmt='{:.2f}')
+
+
+def bench_scaling(sizes, count, num_hints, backend, search, timeout):
+    """Resolve 'count' instâncias aleatórias de cada tamanho de 'sizes',
+    com a frota generator.scaled_fleet(size), e mostra como crescem o
+    tempo e o número de nós expandidos. As instâncias que excedem
+    'timeout' segundos contam como não resolvidas."""
+    table = []
+    for size in sizes:
+        fleet = generator.scaled_fleet(size)
+        times, nodes, solved = [], [], 0
+        for seed in range(count):
+            text, _ = generator.random_instance(size, size, fleet, num_hints, seed)
+            solver = bimaru.BimaruSolver(backend, search)
+            start = time.perf_counter()
+            try:
+                with batch.time_limit(timeout):
+                    solved += solver.solve(text) is not None
+            except batch.SolveTimeout:
+                pass
+            times.append(time.perf_counter() - start)
+            nodes.append(solver.problem.succs)
+        table.append(['{0}x{0}'.format(size), ' '.join(map(str, fleet)), '{}/{}'.format(solved, count),
+                      statistics.median(times) * 1000, max(times) * 1000, statistics.median(nodes)])
+    print_table(table, header=['tamanho', 'frota', 'resolvidas', 'mediana (ms)', 'máximo (ms)', 'nós (mediana)'],
+                numfmt='{:.1f}')
+
+
+def bench_propagation(paths, backend, search):
+    """Compara a propagação por varrimento completo com a propagação por
+    fila de linhas alteradas: tempo, nós expandidos e passos de propagação
+    (células examinadas, a mesma unidade nos dois modos) por ação aplicada."""
+    table = []
+    for path in paths:
+        board = bimaru.load_instance(path)
+        row, reference = [path], None
+        for propagation in bimaru.PROPAGATIONS:
+            solver = bimaru.BimaruSolver(backend, search, propagation)
+            start = time.perf_counter()
+            solution = solver.solve(board)
+            elapsed = time.perf_counter() - start
+            solution = solution and solution.solution_string()
+            if propagation == bimaru.PROPAGATIONS[0]:
+                reference = solution
+            elif solution != reference:
+                raise AssertionError("{}: a solução com propagação {} difere".format(path, propagation))
+            problem = solver.problem.problem
+            row += [elapsed * 1000, problem.propagation_steps / max(problem.propagated_actions, 1),
+                    problem.max_propagation_steps]
+        row.insert(1, solver.problem.succs)
+        table.append(row)
+    header = ['instância', 'nós']
+    for propagation in bimaru.PROPAGATIONS:
+        header += ['{} (ms)'.format(propagation), 'células/ação', 'máx. células']
+    print_table(table, header=header, numfmt='{:.1f}')
+
+
+def bench_exact_cover(paths, backend, search, limit):
+    """Compara a procura de Bimaru (com 'backend' e 'search') com o
+    algoritmo X de bimaru.exact_cover_search: tempo e nós até à primeira
+    solução, e tempo e número de soluções contadas pelo algoritmo X (até
+    'limit'). Quando a solução é única, as duas procuras têm de dar a
+    mesma."""
+    table = []
+    for path in paths:
+        board = bimaru.load_instance(path)
+        row, solutions = [path], []
+        for name in (search, 'dlx'):
+            solver = bimaru.BimaruSolver(backend, name)
+            start = time.perf_counter()
+            solver.solve(board)
+            row += [(time.perf_counter() - start) * 1000, solver.problem.succs]
+            solutions.append(render_solution(solver.node))
+        start = time.perf_counter()
+        count, _, _ = bimaru.count_solutions(board, limit)
+        row += [(time.perf_counter() - start) * 1000, count]
+        if count == 1 and solutions[0] != solutions[1]:
+            raise AssertionError("{}: a solução única do algoritmo X difere da da procura".format(path))
+        table.append(row)
+    header = ['instância', '{} (ms)'.format(search or 'auto'), 'nós', 'dlx (ms)', 'nós dlx', 'contagem (ms)',
+              'soluções']
+    print_table(table, header=header, numfmt='{:.1f}')
+
+
+def bench_heuristics(paths, heuristics, backend, timeout):
+    """Resolve cada instância com a procura A* e cada heurística de
+    'heuristics' e mostra os nós expandidos (e o tempo). As resoluções que
+    excedem 'timeout' segundos aparecem como '-'."""
+    table = []
+    for path in paths:
+        board = bimaru.load_instance(path)
+        row = [path]
+        for heuristic in heuristics:
+            solver = bimaru.BimaruSolver(backend, 'astar', heuristic=heuristic)
+            start = time.perf_counter()
+            try:
+                with batch.time_limit(timeout):
+                    solver.solve(board)
+            except batch.SolveTimeout:
+                row += ['-', '-']
+                continue
+            row += [solver.problem.succs, (time.perf_counter() - start) * 1000]
+        table.append(row)
+    header = ['instância']
+    for heuristic in heuristics:
+        header += ['nós ' + heuristic, '(ms)']
+    print_table(table, header=header, numfmt='{:.0f}')
+
+
+def bench_branching(paths, backend, search, timeout):
+    """Compara os modos de bimaru.BRANCHINGS: nós expandidos, fator de
+    ramificação médio por nó expandido e tempo. As resoluções que excedem
+    'timeout' segundos aparecem como '-'."""
+    table = []
+    for path in paths:
+        board = bimaru.load_instance(path)
+        row = [path]
+        for branching in bimaru.BRANCHINGS:
+            solver = bimaru.BimaruSolver(backend, search, branching=branching)
+            start = time.perf_counter()
+            try:
+                with batch.time_limit(timeout):
+                    solver.solve(board)
+            except batch.SolveTimeout:
+                row += ['-', '-', '-']
+                continue
+            elapsed = time.perf_counter() - start
+            factors = solver.problem.problem.branching_factors
+            mean = sum(k * n for k, n in factors.items()) / max(sum(factors.values()), 1)
+            row += [solver.problem.succs, mean, elapsed * 1000]
+        table.append(row)
+    header = ['instância']
+    for branching in bimaru.BRANCHINGS:
+        header += ['nós ' + branching, 'ramificação', '(ms)']
+    print_table(table, header=header, numfmt='{:.2f}')
+
+
+def bench_transpositions(paths, backend, searches, size, timeout):
+    """Resolve cada instância com cada procura de 'searches', sem e com uma
+    tabela de transposições de 'size' entradas, e mostra os nós expandidos
+    e a taxa de estados repetidos encontrados na tabela."""
+    table = []
+    for path in paths:
+        board = bimaru.load_instance(path)
+        row = [path]
+        for search in searches:
+            for transpositions in (0, size):
+                solver = bimaru.BimaruSolver(backend, search, transpositions=transpositions)
+                try:
+                    with batch.time_limit(timeout):
+                        solver.solve(board)
+                except batch.SolveTimeout:
+                    row += ['-'] * (2 if transpositions else 1)
+                    continue
+                row.append(solver.problem.succs)
+                if transpositions:
+                    row.append(solver.problem.problem.table.hit_rate() * 100)
+        table.append(row)
+    header = ['instância']
+    for search in searches:
+        header += ['nós ' + search, 'com tabela', 'repetidos (%)']
+    print_table(table, header=header, numfmt='{:.1f}')
+
+
+def tree_size(problem, limit):
+    """Percorre a árvore de procura inteira de 'problem' em profundidade,
+    até 'limit' nós. Devolve (nós gerados, objetivos encontrados) ou None
+    se a árvore tem mais do que 'limit' nós."""
+    frontier = [Node(problem.initial)]
+    nodes = goals = 0
+    while frontier:
+        node = frontier.pop()
+        nodes += 1
+        if nodes > limit:
+            return None
+        if problem.goal_test(node.state):
+            goals += 1
+        else:
+            frontier.extend(node.expand(problem))
+    return nodes, goals
+
+
+def bench_symmetry(paths, backend, search, limit, timeout):
+    """Compara a procura sem e com a ordem canónica dos barcos
+    (bimaru.Bimaru.canonical): nós expandidos até à primeira solução e
+    nós e objetivos da árvore de procura completa, que só se percorre se
+    tiver até 'limit' nós. Os objetivos contam cada disposição tantas
+    vezes quantas as ordens pelas quais é gerada."""
+    table = []
+    for path in paths:
+        board = bimaru.load_instance(path)
+        row = [path]
+        for symmetry in (False, True):
+            solver = bimaru.BimaruSolver(backend, search, symmetry=symmetry)
+            try:
+                with batch.time_limit(timeout):
+                    solver.solve(board)
+                row.append(solver.problem.succs)
+            except batch.SolveTimeout:
+                row.append('-')
+        for symmetry in (False, True):
+            row += tree_size(bimaru.Bimaru(board, backend, symmetry=symmetry), limit) or ['-', '-']
+        table.append(row)
+    header = ['instância', 'nós', 'canónica', 'árvore', 'objetivos', 'árvore canónica', 'objetivos']
+    print_table(table, header=header, numfmt='{:.0f}')
+
+
+MIN_REGRESSION_TIME = 0.05  # Segundos; abaixo disto as diferenças de tempo são ruído
+
+
+def corpus_run(board, backend, search, timeout, trace=False):
+    """Resolve 'board' com um BimaruSolver novo e devolve (estado, nós
+    expandidos, tempo). Com 'trace', mede com tracemalloc e devolve o pico
+    de memória em KiB em vez do tempo."""
+    solver = bimaru.BimaruSolver(backend, search)
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with batch.time_limit(timeout):
+            status = 'solved' if solver.solve(board) is not None else 'unsolvable'
+    except batch.SolveTimeout:
+        status = 'timeout'
+    elapsed = time.perf_counter() - start
+    nodes = solver.problem.succs if solver.problem is not None else 0
+    if trace:
+        elapsed = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+    return status, nodes, elapsed
+
+
+def bench_corpus(paths, searches, backend, timeout, output, baseline, tolerance):
+    """Resolve cada instância com cada procura de 'searches' e guarda em
+    'output' (JSON) o estado, os nós expandidos, o tempo, os nós por
+    segundo e o pico de memória de cada resolução. O pico de memória vem
+    de uma segunda resolução com tracemalloc, para não pesar no tempo.
+
+    Com 'baseline' (um JSON escrito antes por esta função), compara cada
+    resolução com a guardada e assinala como regressão um estado
+    diferente, mais nós ou um tempo maior do que (1 + tolerance) vezes o
+    anterior mais MIN_REGRESSION_TIME. Devolve o número de regressões."""
+    results = {}
+    for path in paths:
+        board = bimaru.load_instance(path)
+        results[path] = {}
+        for search in searches:
+            status, nodes, elapsed = corpus_run(board, backend, search, timeout)
+            peak = corpus_run(board, backend, search, timeout, trace=True)[2]
+            results[path][search] = {'status': status, 'nodes': nodes, 'time': elapsed,
+                                     'nodes_per_sec': nodes / elapsed if elapsed else 0, 'peak_kib': peak}
+    report = {'python': platform.python_version(), 'backend': backend, 'timeout': timeout, 'results': results}
+    if output:
+        with open(output, 'w') as out:
+            json.dump(report, out, indent=1, sort_keys=True)
+
+    previous = {}
+    if baseline:
+        with open(baseline) as base:
+            previous = json.load(base)['results']
+    table, regressions = [], 0
+    for path in paths:
+        for search in searches:
+            run = results[path][search]
+            row = [path, search, run['status'], run['nodes'], run['time'] * 1000, run['nodes_per_sec'],
+                   run['peak_kib']]
+            old = previous.get(path, {}).get(search)
+            if old is not None:
+                worse = (run['status'] != old['status'] or run['nodes'] > old['nodes']
+                         or run['time'] > (1 + tolerance) * old['time'] + MIN_REGRESSION_TIME)
+                regressions += worse
+                row += [run['time'] / old['time'] if old['time'] else 0, 'REGRESSÃO' if worse else '']
+            table.append(row)
+    header = ['instância', 'procura', 'estado', 'nós', 'tempo (ms)', 'nós/s', 'pico (KiB)']
+    if baseline:
+        header += ['tempo/base', '']
+    print_table(table, header=header, numfmt='{:.1f}')
+    if baseline:
+        print('{} regressões'.format(regressions))
+    return regressions
+
+
+def expand_paths(patterns):
+    paths = []
+    for pattern in patterns:
+        paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks do solver de Bimaru.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backends_parser = subparsers.add_parser("backends", help="compara as representações de tabuleiro")
+    backends_parser.add_argument("instances", nargs="*", default=["instance*.txt"])
+    backends_parser.add_argument("--repeat", type=int, default=3)
+
+    trail_parser = subparsers.add_parser("trail", help="compara a DFS com cópias com a DFS em modo trail")
+    trail_parser.add_argument("instances", nargs="*", default=["instance*.txt"])
+    trail_parser.add_argument("--repeat", type=int, default=3)
+
+    threads_parser = subparsers.add_parser("threads", help="escalabilidade de batch.solve_threaded")
+    threads_parser.add_argument("instances", nargs="*", default=["instance*.txt"])
+    threads_parser.add_argument("--copies", type=int, default=4, help="cópias de cada instância a resolver")
+    threads_parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+
+    scaling_parser = subparsers.add_parser("scaling", help="tempo de resolução em função do tamanho do tabuleiro")
+    scaling_parser.add_argument("--sizes", type=int, nargs="+", default=[6, 8, 10, 12, 15, 20])
+    scaling_parser.add_argument("--count", type=int, default=10, help="instâncias por tamanho")
+    scaling_parser.add_argument("--hints", type=int, default=6, help="pistas por instância")
+    scaling_parser.add_argument("--backend", choices=sorted(bimaru.BACKENDS), default="bitboard")
+    scaling_parser.add_argument("--search", choices=sorted(bimaru.SEARCHES), default="trail")
+    scaling_parser.add_argument("--timeout", type=float, default=30)
+
+    propagation_parser = subparsers.add_parser("propagation", help="varrimento completo vs. fila de propagação")
+    propagation_parser.add_argument("instances", nargs="*", default=["instance*.txt"])
+    propagation_parser.add_argument("--backend", choices=sorted(bimaru.BACKENDS), default="bitboard")
+    propagation_parser.add_argument("--search", choices=sorted(bimaru.SEARCHES), default="trail")
+
+    exact_cover_parser = subparsers.add_parser("exact-cover", help="procura de Bimaru vs. algoritmo X (dancing links)")
+    exact_cover_parser.add_argument("instances", nargs="*", default=["instance*.txt"])
+    exact_cover_parser.add_argument("--backend", choices=sorted(bimaru.BACKENDS), default="list")
+    exact_cover_parser.add_argument("--search", choices=sorted(bimaru.SEARCHES), default=None)
+    exact_cover_parser.add_argument("--limit", type=int, default=None, help="máximo de soluções a contar")
+
+    heuristics_parser = subparsers.add_parser("heuristics", help="nós expandidos pela A* com cada heurística")
+    heuristics_parser.add_argument("instances", nargs="*", default=["instance*.txt"])
+    heuristics_parser.add_argument("--heuristics", nargs="+", choices=sorted(bimaru.HEURISTICS),
+                                   default=list(bimaru.HEURISTICS))
+    heuristics_parser.add_argument("--backend", choices=sorted(bimaru.BACKENDS), default="bitboard")
+    heuristics_parser.add_argument("--timeout", type=float, default=30)
+
+    branching_parser = subparsers.add_parser("branching", help="varrimento vs. restrição mais apertada")
+    branching_parser.add_argument("instances", nargs="*", default=["instance*.txt"])
+    branching_parser.add_argument("--backend", choices=sorted(bimaru.BACKENDS), default="bitboard")
+    branching_parser.add_argument("--search", choices=sorted(bimaru.SEARCHES), default="trail")
+    branching_parser.add_argument("--timeout", type=float, default=60)
+
+    transpositions_parser = subparsers.add_parser("transpositions", help="nós expandidos sem e com tabela de transposições")
+    transpositions_parser.add_argument("instances", nargs="*", default=["instance*.txt"])
+    transpositions_parser.add_argument("--backend", choices=sorted(bimaru.BACKENDS), default="bitboard")
+    transpositions_parser.add_argument("--searches", nargs="+", choices=sorted(bimaru.SEARCHES),
+                                       default=["trail", "astar"])
+    transpositions_parser.add_argument("--size", type=int, default=1 << 20, help="entradas da tabela")
+    transpositions_parser.add_argument("--timeout", type=float, default=60)
+
+    symmetry_parser = subparsers.add_parser("symmetry", help="nós expandidos sem e com a ordem canónica dos barcos")
+    symmetry_parser.add_argument("instances", nargs="*", default=["instance*.txt"])
+    symmetry_parser.add_argument("--backend", choices=sorted(bimaru.BACKENDS), default="bitboard")
+    symmetry_parser.add_argument("--search", choices=sorted(bimaru.SEARCHES), default="trail")
+    symmetry_parser.add_argument("--limit", type=int, default=100000, help="máximo de nós da árvore completa")
+    symmetry_parser.add_argument("--timeout", type=float, default=60)
+
+    corpus_parser = subparsers.add_parser("corpus", help="linha de base (JSON) de nós, nós/s e memória por procura")
+    corpus_parser.add_argument("instances", nargs="*", default=["instance*.txt"])
+    corpus_parser.add_argument("--searches", nargs="+", choices=sorted(bimaru.SEARCHES),
+                               default=[search for search in bimaru.SEARCHES if search != 'parallel'])
+    corpus_parser.add_argument("--backend", choices=sorted(bimaru.BACKENDS), default="bitboard")
+    corpus_parser.add_argument("--timeout", type=float, default=60)
+    corpus_parser.add_argument("--output", help="ficheiro JSON onde guardar os resultados")
+    corpus_parser.add_argument("--baseline", help="JSON de uma execução anterior com que comparar")
+    corpus_parser.add_argument("--tolerance", type=float, default=0.2,
+                               help="aumento relativo de tempo tolerado antes de contar como regressão")
+
+    args = parser.parse_args()
+    if args.command == "backends":
+        bench_backends(expand_paths(args.instances), args.repeat)
+    elif args.command == "trail":
+        bench_trail(expand_paths(args.instances), args.repeat)
+    elif args.command == "threads":
+        bench_threads(expand_paths(args.instances), args.copies, args.max_workers)
+    elif args.command == "propagation":
+        bench_propagation(expand_paths(args.instances), args.backend, args.search)
+    elif args.command == "exact-cover":
+        bench_exact_cover(expand_paths(args.instances), args.backend, args.search, args.limit)
+    elif args.command == "heuristics":
+        bench_heuristics(expand_paths(args.instances), args.heuristics, args.backend, args.timeout)
+    elif args.command == "branching":
+        bench_branching(expand_paths(args.instances), args.backend, args.search, args.timeout)
+    elif args.command == "transpositions":
+        bench_transpositions(expand_paths(args.instances), args.backend, args.searches, args.size, args.timeout)
+    elif args.command == "symmetry":
+        bench_symmetry(expand_paths(args.instances), args.backend, args.search, args.limit, args.timeout)
+    elif args.command == "corpus":
+        regressions = bench_corpus(expand_paths(args.instances), args.searches, args.backend, args.timeout,
+                                   args.output, args.baseline, args.tolerance)
+        sys.exit(1 if regressions else 0)
+    elif args.command == "scaling":
+        bench_scaling(args.sizes, args.count, args.hints, args.backend, args.search, args.timeout)
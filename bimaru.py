@@ -1,39 +1,119 @@
 # 103449 Miguel Alexandre Rodrigues Teixeira
 # bimaru.py: Projeto de Inteligência Artificial 2022/2023.
 
+import argparse
 import copy
+import functools
+import hashlib
+import io
+import itertools
+import json
+import mmap
+import multiprocessing
+import os
+import queue
+import random
+import sqlite3
 import sys
-
+import threading
+import time
+from array import array
+from collections import Counter, OrderedDict
+from contextlib import contextmanager, nullcontext
+
+from dlx import ExactCover
+from sat import CNF, CDCLSolver
 from search import (
     Problem,
     Node,
+    InstrumentedProblem,
     depth_first_tree_search,
     astar_search
 )
 
-MAX_LENGTH = 10
+DEFAULT_FLEET = (4, 3, 2, 1)  # Número de barcos de comprimento 1, 2, 3, 4
 VERT = True
 HORIZ = False
 HINT = 0
 HINT_OVERLAP = 1
 SHIP_PRIO = 2
 SHIP_NO_PRIO = 3
-count = 0
-hint_num = 0
-astar_flag = True
+WATER = 4
 
 
 class BimaruState:
-    state_id = 0
-
-    def __init__(self, board):
+    def __init__(self, board, state_id=0):
         self.board = board
-        self.id = BimaruState.state_id
-        BimaruState.state_id += 1
+        self.id = state_id  # Ordem de criação dentro de um mesmo Bimaru
 
     def __lt__(self, other):
         return self.id < other.id
 
+    def __eq__(self, other):
+        """Sem hashing no tabuleiro (ver Board.enable_hashing), cada estado
+        só é igual a si próprio. Com hashing, dois estados são iguais se os
+        tabuleiros tiverem o mesmo conteúdo, pelo que o conjunto 'explored'
+        da procura em grafo deteta os tabuleiros repetidos."""
+        if self.board.zobrist is None or not isinstance(other, BimaruState):
+            return self is other
+        return (self.board.state_key() == other.board.state_key()
+                and self.board.contents() == other.board.contents())
+
+    def __hash__(self):
+        return id(self) if self.board.zobrist is None else self.board.state_key()
+
+
+_zobrist_keys = {}
+_zobrist_random = random.Random(0x5EED)
+
+
+def zobrist_key(row, col, value):
+    """Número aleatório de 64 bits, fixo durante a execução, do valor
+    'value' na célula (row, col). As células por preencher valem 0."""
+    if value is None:
+        return 0
+    key = _zobrist_keys.get((row, col, value))
+    if key is None:
+        key = _zobrist_keys.setdefault((row, col, value), _zobrist_random.getrandbits(64))
+    return key
+
+
+class TranspositionTable:
+    """Conjunto limitado das chaves (Board.state_key) dos estados já
+    expandidos. Quando está cheio esquece a chave usada há mais tempo, pelo
+    que perde duplicados mas nunca dá falsos positivos além das colisões
+    de 64 bits."""
+
+    def __init__(self, size):
+        self.size = size
+        self.keys = OrderedDict()
+        self.lookups = 0
+        self.hits = 0
+
+    def seen(self, key):
+        """Regista 'key' e indica se já estava na tabela."""
+        if self.lookup(key):
+            return True
+        self.add(key)
+        return False
+
+    def lookup(self, key):
+        """Indica se 'key' está na tabela, sem a registar."""
+        self.lookups += 1
+        if key in self.keys:
+            self.keys.move_to_end(key)
+            self.hits += 1
+            return True
+        return False
+
+    def add(self, key):
+        self.keys[key] = None
+        if len(self.keys) > self.size:
+            self.keys.popitem(last=False)
+
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
 
 def can_change_cell(value):
     return value not in ('T', 'B', 'M', 'W', 'L', 'R', 'C')
@@ -42,47 +122,194 @@ def can_change_cell(value):
 class Board:
     """Representação interna de um tabuleiro de Bimaru."""
 
-    def __init__(self, board, rows, columns, hints):
+    def __init__(self, board, rows, columns, hints, fleet=DEFAULT_FLEET):
         self.board = board  # Matriz
         self.rows = rows  # Lista  com numero de peças de barco por linha
         self.columns = columns  # Lista  com numero de peças de barco por coluna
         self.hints = hints
-        self.ships = [4, 3, 2, 1]
-        self.cells_left_row = [10] * MAX_LENGTH
-        self.cells_left_col = [10] * MAX_LENGTH
+        self.height = len(rows)
+        self.width = len(columns)
+        self.ships = list(fleet)  # ships[i] é o número de barcos de comprimento i + 1 por colocar
+        self.max_ship = len(self.ships)
+        self.cells_left_row = [self.width] * self.height
+        self.cells_left_col = [self.height] * self.width
+        self.count_totals()
         self.lastpos = (0, 0)
         self.wrong = False
+        self.trail = None  # Registo de alterações a desfazer na procura em modo trail
+        self.propagation = 'rescan'  # Ver propagate_placement
+        self.queue = None  # Fila de linhas (0..height-1) e colunas (height + col) a propagar
+        self.stale = True  # No modo 'worklist', a primeira propagação vê todas as linhas
+        self.steps = 0  # Células examinadas pela propagação (ver fill_row_water e place_row_ships)
+        self.zobrist = None  # Hash de Zobrist das células, se enable_hashing() foi chamado
+
+    @classmethod
+    def from_board(cls, board):
+        """Constrói um tabuleiro desta representação com o mesmo conteúdo
+        e os mesmos contadores de 'board'."""
+        matrix = [[board.get_value(r, c) for c in range(len(board.columns))] for r in range(len(board.rows))]
+        new_board = cls(matrix, board.rows[:], board.columns[:], board.hints[:], board.ships)
+        new_board.cells_left_row = board.cells_left_row[:]
+        new_board.cells_left_col = board.cells_left_col[:]
+        new_board.count_totals()
+        new_board.lastpos = board.lastpos
+        new_board.wrong = board.wrong
+        return new_board
+
+    def to_bytes(self):
+        """Serializa o estado do tabuleiro numa forma compacta, para passar
+        entre processos: um array de inteiros de 16 bits com as dimensões,
+        lastpos, wrong, os contadores, a frota e as pistas, seguido de um
+        byte por célula (o código ASCII do valor, 0 se por preencher)."""
+        hints = [field for row, col, value in self.hints for field in (row, col, ord(value))]
+        header = array('h', [self.height, self.width, self.max_ship, len(self.hints), *self.lastpos, self.wrong,
+                             *self.rows, *self.columns, *self.cells_left_row, *self.cells_left_col, *self.ships,
+                             *hints])
+        cells = bytes(ord(value) if value else 0 for value in
+                      (self.get_value(row, col) for row in range(self.height) for col in range(self.width)))
+        return header.tobytes() + cells
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Reconstrói, nesta representação, um tabuleiro serializado com
+        to_bytes."""
+        height, width, max_ship, num_hints = array('h', data[:8])
+        size = 7 + 2 * (height + width) + max_ship + 3 * num_hints
+        fields = array('h', data[:2 * size])
+        cells = data[2 * size:]
+        counters = iter(fields[7:])
+        rows, columns, cells_left_row, cells_left_col, ships = (
+            [next(counters) for _ in range(length)] for length in (height, width, height, width, max_ship))
+        hints = [(next(counters), next(counters), chr(next(counters))) for _ in range(num_hints)]
+        matrix = [[chr(cells[row * width + col]) if cells[row * width + col] else None for col in range(width)]
+                  for row in range(height)]
+        board = cls(matrix, rows, columns, hints, ships)
+        board.cells_left_row = cells_left_row
+        board.cells_left_col = cells_left_col
+        board.count_totals()
+        board.lastpos = (fields[4], fields[5])
+        board.wrong = bool(fields[6])
+        return board
+
+    def count_totals(self):
+        """Recalcula os totais mantidos incrementalmente: 'cells_left' é
+        sum(cells_left_row) + sum(cells_left_col) e 'pieces_left' é
+        sum(rows) + sum(columns)."""
+        self.cells_left = sum(self.cells_left_row) + sum(self.cells_left_col)
+        self.pieces_left = sum(self.rows) + sum(self.columns)
+
+    def cells_hash(self):
+        """Hash de Zobrist de todas as células, calculado de raiz."""
+        zobrist = 0
+        for row in range(self.height):
+            for col in range(self.width):
+                zobrist ^= zobrist_key(row, col, self.get_value(row, col))
+        return zobrist
+
+    def enable_hashing(self):
+        """Passa a manter em 'zobrist' o hash das células, atualizado a
+        cada célula escrita."""
+        self.zobrist = self.cells_hash()
+
+    def rehash_cell(self, row, col, old, new):
+        if self.zobrist is not None:
+            self.set_attr('zobrist', self.zobrist ^ zobrist_key(row, col, old) ^ zobrist_key(row, col, new))
+
+    def state_key(self):
+        """Chave do estado: o hash das células combinado com a frota por
+        colocar, as pistas por aplicar e lastpos, que também determinam as
+        ações seguintes."""
+        zobrist = self.cells_hash() if self.zobrist is None else self.zobrist
+        return zobrist ^ hash((tuple(self.ships), tuple(self.hints), self.lastpos))
+
+    def contents(self):
+        """Tudo o que state_key resume, para comparar estados sem depender
+        do hash."""
+        cells = tuple(self.get_value(row, col) for row in range(self.height) for col in range(self.width))
+        return cells, tuple(self.ships), tuple(self.hints), self.lastpos
+
+    def copy(self):
+        """Devolve uma cópia independente do tabuleiro."""
+        return copy.deepcopy(self)
+
+    def copy_counters(self):
+        """Cópia rasa do tabuleiro com listas próprias de contagens, pistas
+        e barcos. As representações que guardam as células fora de
+        self.board (BitBoard, FlatBoard) copiam-nas à parte."""
+        new_board = copy.copy(self)
+        new_board.rows = self.rows[:]
+        new_board.columns = self.columns[:]
+        new_board.hints = self.hints[:]
+        new_board.ships = self.ships[:]
+        new_board.cells_left_row = self.cells_left_row[:]
+        new_board.cells_left_col = self.cells_left_col[:]
+        return new_board
+
+    def set_item(self, container, key, value):
+        """Escreve container[key] = value. Com o trail ativo, regista o
+        valor anterior para que undo() o possa repor."""
+        if self.trail is not None:
+            self.trail.append((container, key, container[key]))
+        container[key] = value
+
+    def set_attr(self, name, value):
+        self.set_item(self.__dict__, name, value)
+
+    def mark(self):
+        """Devolve a posição atual do trail, a passar depois a undo()."""
+        return len(self.trail)
+
+    def undo(self, mark):
+        """Desfaz todas as alterações registadas depois de 'mark'."""
+        trail = self.trail
+        while len(trail) > mark:
+            container, key, value = trail.pop()
+            container[key] = value
+
+    def pop_hint(self, hint=None):
+        """Retira e devolve a pista 'hint' (por omissão, a primeira)."""
+        index = 0 if hint is None else self.hints.index(hint)
+        hint = self.hints[index]
+        self.set_attr('hints', self.hints[:index] + self.hints[index + 1:])
+        return hint
 
     def get_value(self, row: int, col: int) -> str:
         """Devolve o valor na respetiva posição do tabuleiro."""
-        return self.board[row][col] if 0 <= row < len(self.board) and 0 <= col < len(self.board[0]) else None
+        return self.board[row][col] if 0 <= row < self.height and 0 <= col < self.width else None
 
     def adjacent_vertical_values(self, row: int, col: int) -> (str, str):
         """Devolve os valores imediatamente acima e abaixo,
         respectivamente."""
         above = self.get_value(row - 1, col) if row - 1 >= 0 else None
-        below = self.get_value(row + 1, col) if row + 1 < len(self.board) else None
+        below = self.get_value(row + 1, col) if row + 1 < self.height else None
         return above, below
 
     def adjacent_horizontal_values(self, row: int, col: int) -> (str, str):
         """Devolve os valores imediatamente à esquerda e à direita,
         respectivamente."""
         left = self.get_value(row, col - 1) if col - 1 >= 0 else None
-        right = self.get_value(row, col + 1) if col + 1 < len(self.board[0]) else None
+        right = self.get_value(row, col + 1) if col + 1 < self.width else None
         return left, right
 
     def adjacent_diagonal_values(self, row: int, col: int) -> (str, str, str, str):
         """Devolve os valores imediatamente nas diagonais, respetivamente."""
         lt = self.get_value(row - 1, col - 1) if row - 1 >= 0 and col - 1 >= 0 else None
-        rt = self.get_value(row - 1, col + 1) if row - 1 >= 0 and col + 1 < len(self.board[0]) else None
-        lb = self.get_value(row + 1, col - 1) if row + 1 < len(self.board) and col - 1 >= 0 else None
-        rb = self.get_value(row + 1, col + 1) if row + 1 < len(self.board) and col + 1 < len(self.board[0]) else None
+        rt = self.get_value(row - 1, col + 1) if row - 1 >= 0 and col + 1 < self.width else None
+        lb = self.get_value(row + 1, col - 1) if row + 1 < self.height and col - 1 >= 0 else None
+        rb = self.get_value(row + 1, col + 1) if row + 1 < self.height and col + 1 < self.width else None
         return lt, rt, lb, rb
 
     @staticmethod
-    def parse_instance():
+    def parse_instance(stream=None):
         """Lê o test do standard input (stdin) que é passado como argumento
-        e retorna uma instância da classe Board.
+        e retorna uma instância da classe Board. Em alternativa ao stdin,
+        'stream' pode ser um ficheiro já aberto ou uma string com a
+        instância.
+
+        O tabuleiro tem tantas linhas e colunas quantos os valores de ROW e
+        COLUMN. A seguir a COLUMN pode vir uma linha FLEET com o número de
+        barcos de cada comprimento (1, 2, 3, ...); sem ela usa-se a frota
+        clássica DEFAULT_FLEET.
 
         Por exemplo:
             $ python3 bimaru.py < input_T01
@@ -90,69 +317,76 @@ class Board:
             > from sys import stdin
             > line = stdin.readline().split()
         """
-        global hint_num, astar_flag
-        matrix = [[None for _ in range(MAX_LENGTH)] for _ in range(MAX_LENGTH)]
-        rows = list(map(int, sys.stdin.readline().split()[1:]))
-        columns = list(map(int, sys.stdin.readline().split()[1:]))
-        astar_flag = any(num >= 4 for num in rows[:5])
-        num_hints = int(sys.stdin.readline().strip())
+        if stream is None:
+            stream = sys.stdin
+        elif isinstance(stream, str):
+            stream = io.StringIO(stream)
+        rows = list(map(int, stream.readline().split()[1:]))
+        columns = list(map(int, stream.readline().split()[1:]))
+        line = stream.readline().split()
+        fleet = DEFAULT_FLEET
+        if line[0] == 'FLEET':
+            fleet = list(map(int, line[1:]))
+            line = stream.readline().split()
+        num_hints = int(line[0])
         hints = []
-        hint_num = num_hints
         for _ in range(num_hints):
-            hint = input().strip().split()[1:]
+            hint = stream.readline().strip().split()[1:]
             row, col, value = int(hint[0]), int(hint[1]), hint[2]
             hints.append((row, col, value))
-        board = Board(matrix, rows, columns, hints)
+        return Board.from_instance(rows, columns, hints, fleet)
+
+    @staticmethod
+    def from_instance(rows, columns, hints, fleet=DEFAULT_FLEET):
+        """Constrói o tabuleiro inicial de uma instância já lida: a grelha
+        vazia com as linhas e colunas sem barcos já cheias de água."""
+        matrix = [[None] * len(columns) for _ in range(len(rows))]
+        board = Board(matrix, rows, columns, hints, fleet)
         board.fill_board_water()
         return board
 
     def __str__(self):
         """Imprime a grelha atual"""
-        matrix = ""
-        for i in range(MAX_LENGTH):
-            matrix += str(self.columns[i]) + " "
-        matrix += "\n"
-        for r in range(10):
-            for c in range(10):
-                value = self.get_value(r, c)
-                matrix += self.get_value(r, c) + " " if value else "- "
-            matrix += str(self.rows[r])
-            matrix += "\n"
-        # matrix = matrix[:-1]
-        return matrix
+        lines = [''.join(str(count) + ' ' for count in self.columns)]
+        for r, line in enumerate(self.solution_lines()):
+            lines.append(''.join(value + ' ' for value in line) + str(self.rows[r]))
+        return '\n'.join(lines) + '\n'
+
+    def solution_lines(self):
+        """Devolve as linhas da grelha, com '-' nas células por preencher,
+        lendo cada célula uma só vez."""
+        get_value = self.get_value
+        return [''.join([get_value(r, c) or '-' for c in range(self.width)]) for r in range(self.height)]
+
+    def solution_string(self):
+        """Devolve a grelha tal como é impressa por print_solution."""
+        return '\n'.join(self.solution_lines())
 
     def print_solution(self):
-        matrix = ""
-        for r in range(MAX_LENGTH):
-            for c in range(MAX_LENGTH):
-                value = self.get_value(r, c)
-                matrix += self.get_value(r, c) if value else "-"
-            matrix += "\n"
-        matrix = matrix[:-1]
-        print(matrix)
+        print(self.solution_string())
 
     def add_water_sides(self, row, col, is_vertical):
         if is_vertical:
-            if col + 1 <= 9:
+            if col + 1 < self.width:
                 self.change_cell(row, col + 1, '.')
             if col - 1 >= 0:
                 self.change_cell(row, col - 1, '.')
         else:
             if row - 1 >= 0:
                 self.change_cell(row - 1, col, '.')
-            if row + 1 <= 9:
+            if row + 1 < self.height:
                 self.change_cell(row + 1, col, '.')
 
     def add_water_ends(self, row, col, is_vertical, direction):  # -1 up left 1 down right
         if is_vertical:
             self.add_water_sides(row, col, is_vertical)
             row += direction
-            if not 0 <= row <= 9:
+            if not 0 <= row < self.height:
                 return
         else:
             self.add_water_sides(row, col, is_vertical)
             col += direction
-            if not 0 <= col <= 9:
+            if not 0 <= col < self.width:
                 return
         self.change_cell(row, col, '.')
         self.add_water_sides(row, col, is_vertical)
@@ -170,32 +404,39 @@ class Board:
         return self.rows[row] != 0
 
     def fill_board_water(self):
-        for i in range(MAX_LENGTH):
-            if not self.row_has_ship(i) and self.cells_left_row != 0:
+        for i in range(max(self.height, self.width)):
+            if i < self.height and not self.row_has_ship(i) and self.cells_left_row != 0:
                 self.fill_row_water(i)
-            if not self.col_has_ship(i) and self.cells_left_col != 0:
+            if i < self.width and not self.col_has_ship(i) and self.cells_left_col != 0:
                 self.fill_col_water(i)
 
+    def is_overloaded(self):
+        """Indica se alguma linha ou coluna precisa de mais peças do que as
+        células por preencher que lhe restam."""
+        return (any(needed > left for needed, left in zip(self.rows, self.cells_left_row))
+                or any(needed > left for needed, left in zip(self.columns, self.cells_left_col)))
+
     def decrease_piece_count(self, row, col):
-        self.rows[row] -= 1
-        self.columns[col] -= 1
+        self.set_item(self.rows, row, self.rows[row] - 1)
+        self.set_item(self.columns, col, self.columns[col] - 1)
+        self.set_attr('pieces_left', self.pieces_left - 2)
+        if self.queue is not None:
+            self.touch(row, col)
 
     def place_ship(self, ship):
-        for i in range(MAX_LENGTH):
-            if self.rows[i] > self.cells_left_row[i] or self.columns[i] > self.cells_left_col[i]:
-                self.wrong = True
-                return False
+        if self.is_overloaded():
+            self.set_attr('wrong', True)
+            return False
         row, col, length, is_vertical = ship[:4]
         if length == 1:
             self.change_cell(row, col, "c")
             self.decrease_piece_count(row, col)
             self.surround_piece(row, col)
-            self.ships[length - 1] -= 1
+            self.set_item(self.ships, length - 1, self.ships[length - 1] - 1)
             if self.ships[length - 1] < 0:
-                self.wrong = True
+                self.set_attr('wrong', True)
                 return False
-            self.fill_board_water()
-            self.place_guaranteed_ships()
+            self.propagate_placement()
             return True
         length -= 2
         if is_vertical:
@@ -228,37 +469,52 @@ class Board:
             self.change_cell(row, col + length + 1, "r")
             self.decrease_piece_count(row, col + length + 1)
             self.add_water_ends(row, col + length + 1, is_vertical, 1)
-        self.ships[length + 2 - 1] -= 1
+        self.set_item(self.ships, length + 1, self.ships[length + 1] - 1)
         if self.ships[length + 2 - 1] < 0:
-            self.wrong = True
+            self.set_attr('wrong', True)
             return False
-        self.fill_board_water()
-        self.place_guaranteed_ships()
+        self.propagate_placement()
         return True
 
     def change_cell(self, row, col, value):
         if can_change_cell(self.get_value(row, col)):
             if self.get_value(row, col) is None:
                 self.decrease_cell_left(row, col)
-            self.board[row][col] = value
+            self.rehash_cell(row, col, self.board[row][col], value)
+            self.set_item(self.board[row], col, value)
 
     def fill_row_water(self, row):
+        """Enche de água as células vazias da linha. Em todas as
+        representações, conta as 'width' células da linha em 'steps'."""
+        self.steps += self.width
         for col in range(len(self.board[row])):
             cell = self.board[row][col]
             if cell is None:
                 self.change_cell(row, col, '.')
-        self.cells_left_row[row] = 0
+        self.clear_row_left(row)
 
     def fill_col_water(self, col):
+        self.steps += self.height
         for row_i, row in enumerate(self.board):
             cell = row[col]
             if cell is None:
                 self.change_cell(row_i, col, '.')
-        self.cells_left_col[col] = 0
+        self.clear_col_left(col)
 
     def decrease_cell_left(self, row, col, amount=1):
-        self.cells_left_row[row] -= amount
-        self.cells_left_col[col] -= amount
+        self.set_item(self.cells_left_row, row, self.cells_left_row[row] - amount)
+        self.set_item(self.cells_left_col, col, self.cells_left_col[col] - amount)
+        self.set_attr('cells_left', self.cells_left - 2 * amount)
+        if self.queue is not None:
+            self.touch(row, col)
+
+    def clear_row_left(self, row):
+        self.set_attr('cells_left', self.cells_left - self.cells_left_row[row])
+        self.set_item(self.cells_left_row, row, 0)
+
+    def clear_col_left(self, col):
+        self.set_attr('cells_left', self.cells_left - self.cells_left_col[col])
+        self.set_item(self.cells_left_col, col, 0)
 
     def is_cell_empty(self, row, col):
         return self.get_value(row, col) is None
@@ -271,6 +527,8 @@ class Board:
 
     def can_place_ship(self, ship):
         row, col, length, is_vertical = ship[:4]
+        if row < 0 or col < 0:
+            return False
         if is_vertical is None:
             if not self.can_fit_col(length, col):
                 return False
@@ -278,7 +536,7 @@ class Board:
                 return False
 
         elif is_vertical:
-            if row + length > MAX_LENGTH:
+            if row + length > self.height:
                 return False
             if self.can_fit_col(length, col):
                 for i in range(row, row + length):
@@ -287,7 +545,7 @@ class Board:
             else:
                 return False
         elif not is_vertical:
-            if col + length > MAX_LENGTH:
+            if col + length > self.width:
                 return False
             if self.can_fit_row(length, row):
                 for i in range(col, col + length):
@@ -312,12 +570,12 @@ class Board:
 
     def build_ship_row_consecutive(self, row, col):
         length = 1
-        for i in range(col + 1, MAX_LENGTH):
+        for i in range(col + 1, self.width):
             if self.is_cell_empty(row, i):
                 length += 1
             else:
                 break
-            if length > 4:
+            if length > self.max_ship:
                 return []  # is too long for row wrong board
         if length > 1:
             ship = (row, col, length, HORIZ, SHIP_PRIO)
@@ -326,12 +584,12 @@ class Board:
 
     def build_ship_col_consecutive(self, row, col):
         length = 1
-        for i in range(row + 1, MAX_LENGTH):
+        for i in range(row + 1, self.height):
             if self.is_cell_empty(i, col):
                 length += 1
             else:
                 break
-            if length > 4:
+            if length > self.max_ship:
                 return []  # ship is too long for row wrong board
         if length > 1:
             ship = (row, col, length, VERT, SHIP_PRIO)
@@ -366,59 +624,145 @@ class Board:
                     self.add_ship(row, col_vert, ship_len, HORIZ, ships, SHIP_PRIO)
         return ships
 
+    def free_actions(self):
+        """Devolve as ações SHIP_NO_PRIO: todos os barcos que podem ser
+        colocados a partir de uma célula vazia, percorrendo o tabuleiro a
+        partir de lastpos."""
+        actions = []
+        row = self.lastpos[0]
+        col = self.lastpos[1]
+        for row in range(row, self.height):
+            for col in range(col, self.width):
+                if self.is_cell_empty(row, col):
+                    for ship_len, amount in enumerate(self.ships):
+                        if amount == 0:
+                            continue
+                        ship_len += 1
+                        if ship_len < 1:
+                            continue
+                        if ship_len == 1:
+                            self.add_ship(row, col, ship_len, None, actions, SHIP_NO_PRIO)
+                            continue
+                        self.add_ship(row, col, ship_len, VERT, actions, SHIP_NO_PRIO)
+                        self.add_ship(row, col, ship_len, HORIZ, actions, SHIP_NO_PRIO)
+            col = 0
+        return actions
+
     def overlap_value(self, row, col, value):
-        self.board[row][col] = value
+        self.rehash_cell(row, col, self.board[row][col], value)
+        self.set_item(self.board[row], col, value)
 
     def find_empty_space(self, fixed_coord, current_coord, is_vertical):
 
         if is_vertical:
-            for i in range(current_coord, MAX_LENGTH):
+            for i in range(current_coord, self.height):
                 if self.is_cell_empty(i, fixed_coord):
                     return i
             return None
         else:
-            for i in range(current_coord, MAX_LENGTH):
+            for i in range(current_coord, self.width):
                 if self.is_cell_empty(fixed_coord, i):
                     return i
             return None
 
     def place_guaranteed_ships(self):
-        ship_placed = False
-        for i in range(MAX_LENGTH):
-            row, col = 0, 0
+        for i in range(max(self.height, self.width)):
             if self.wrong:
                 return
-            if self.rows[i] == self.cells_left_row[i] != 0:
-                while col < MAX_LENGTH:
-                    col = self.find_empty_space(i, col, HORIZ)
-                    if col is None:
-                        break
-                    ship = self.build_ship_row_consecutive(i, col)
-                    if ship is None:
-                        col += 2
-                    elif not ship:
-                        self.wrong = True
-                        return
-                    else:
-                        ship = ship[0]
-                        ship_placed = self.place_ship(ship)
-                        col += ship[2] + 1
-            if self.columns[i] == self.cells_left_col[i] != 0:
-                while row < MAX_LENGTH:
-                    cenas = self.find_empty_space(i, row, VERT)
-                    row = cenas
-                    if row is None:
-                        break
-                    ship = self.build_ship_col_consecutive(row, i)
-                    if ship is None:
-                        row += 2
-                    elif not ship:
-                        self.wrong = True
-                        return
-                    else:
-                        ship = ship[0]
-                        ship_placed = self.place_ship(ship)
-                        row += ship[2] + 1
+            if i < self.height and self.rows[i] == self.cells_left_row[i] != 0:
+                if not self.place_row_ships(i):
+                    return
+            if i < self.width and self.columns[i] == self.cells_left_col[i] != 0:
+                if not self.place_col_ships(i):
+                    return
+
+    def place_row_ships(self, i):
+        """Coloca os barcos de uma linha em que todas as células vazias têm
+        de ser barco. Devolve False se a linha tornar o tabuleiro inválido.
+        Conta as células da linha em 'steps', como fill_row_water."""
+        self.steps += self.width
+        col = 0
+        while col < self.width:
+            col = self.find_empty_space(i, col, HORIZ)
+            if col is None:
+                break
+            ship = self.build_ship_row_consecutive(i, col)
+            if ship is None:
+                col += 2
+            elif not ship:
+                self.set_attr('wrong', True)
+                return False
+            else:
+                ship = ship[0]
+                self.place_ship(ship)
+                col += ship[2] + 1
+        return True
+
+    def place_col_ships(self, i):
+        """Como place_row_ships, para a coluna i."""
+        self.steps += self.height
+        row = 0
+        while row < self.height:
+            row = self.find_empty_space(i, row, VERT)
+            if row is None:
+                break
+            ship = self.build_ship_col_consecutive(row, i)
+            if ship is None:
+                row += 2
+            elif not ship:
+                self.set_attr('wrong', True)
+                return False
+            else:
+                ship = ship[0]
+                self.place_ship(ship)
+                row += ship[2] + 1
+        return True
+
+    def propagate_placement(self):
+        """Propaga as consequências de um barco acabado de colocar. No modo
+        'rescan' percorre todas as linhas e colunas; no modo 'worklist' as
+        linhas alteradas já estão na fila e são tratadas por propagate()."""
+        if self.propagation == 'rescan':
+            self.fill_board_water()
+            self.place_guaranteed_ships()
+
+    def start_propagation(self):
+        """Abre a fila de propagação do modo 'worklist'. Na primeira ação
+        depois da leitura entram todas as linhas e colunas; depois, só as
+        que forem alteradas."""
+        if self.stale:
+            self.queue = dict.fromkeys(range(self.height + self.width))
+            self.set_attr('stale', False)
+        else:
+            self.queue = {}
+
+    def touch(self, row, col):
+        """Põe a linha 'row' e a coluna 'col' na fila de propagação."""
+        self.queue[row] = None
+        self.queue[self.height + col] = None
+
+    def propagate(self):
+        """Trata as linhas e colunas em fila até ao ponto fixo: as que já
+        não precisam de peças ficam com água e as que precisam de todas as
+        células vazias recebem os barcos correspondentes. Os passos em
+        'steps' são contados por fill_row_water e place_row_ships (e pelas
+        versões das colunas), tal como no modo 'rescan'."""
+        queue = self.queue
+        while queue and not self.wrong:
+            line = next(iter(queue))
+            del queue[line]
+            if line < self.height:
+                if self.rows[line] == 0:
+                    self.fill_row_water(line)
+                elif self.rows[line] == self.cells_left_row[line]:
+                    self.place_row_ships(line)
+            else:
+                line -= self.height
+                if self.columns[line] == 0:
+                    self.fill_col_water(line)
+                elif self.columns[line] == self.cells_left_col[line]:
+                    self.place_col_ships(line)
+        self.queue = None
 
     def find_next_guaranteed_ship(self, fixed_coord, is_vertical):
         current_cord = self.find_empty_space(fixed_coord, 0, is_vertical)
@@ -436,53 +780,696 @@ class Board:
                 return self.get_actions_with_prio(fixed_coord, current_cord, VERT)
 
 
+PIECE_VALUES = 'tbmlrc'
+_bit_tables_cache = {}
+_placement_cache = {}
+
+
+def bit_tables(height, width):
+    """Devolve as máscaras de cada linha, de cada coluna e dos 8 vizinhos de
+    cada célula para um tabuleiro height x width. O bit da célula (row, col)
+    é row * width + col."""
+    tables = _bit_tables_cache.get((height, width))
+    if tables is None:
+        row_masks = [((1 << width) - 1) << (r * width) for r in range(height)]
+        col_masks = [sum(1 << (r * width + c) for r in range(height)) for c in range(width)]
+        neighbours = []
+        for r in range(height):
+            for c in range(width):
+                mask = 0
+                for dr in (-1, 0, 1):
+                    for dc in (-1, 0, 1):
+                        if (dr or dc) and 0 <= r + dr < height and 0 <= c + dc < width:
+                            mask |= 1 << ((r + dr) * width + c + dc)
+                neighbours.append(mask)
+        tables = (row_masks, col_masks, neighbours)
+        _bit_tables_cache[(height, width)] = tables
+    return tables
+
+
+def placement_masks(height, width, row, col, length, is_vertical):
+    """Devolve (células, vizinhança, peças) de um barco dentro do tabuleiro:
+    a máscara das células ocupadas, a união das vizinhanças dessas células
+    e os pares (índice da peça, máscara) a escrever."""
+    key = (height, width, row, col, length, is_vertical)
+    entry = _placement_cache.get(key)
+    if entry is None:
+        neighbours = bit_tables(height, width)[2]
+        step = width if is_vertical else 1
+        first = row * width + col
+        indexes = [first + i * step for i in range(length)]
+        cells = halo = 0
+        for index in indexes:
+            cells |= 1 << index
+            halo |= neighbours[index]
+        if length == 1:
+            parts = ((PIECE_VALUES.index('c'), cells),)
+        else:
+            start, end = ('t', 'b') if is_vertical else ('l', 'r')
+            parts = ((PIECE_VALUES.index(start), 1 << indexes[0]),
+                     (PIECE_VALUES.index('m'), cells & ~(1 << indexes[0]) & ~(1 << indexes[-1])),
+                     (PIECE_VALUES.index(end), 1 << indexes[-1]))
+        entry = (cells, halo, parts)
+        _placement_cache[key] = entry
+    return entry
+
+
+def iter_bits(mask):
+    """Percorre os índices dos bits a 1 de 'mask'."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class BitBoard(Board):
+    """Representação de um tabuleiro de Bimaru em máscaras de bits.
+
+    Cada classe de célula (por preencher, água, barco, pista) é um inteiro
+    em que o bit row * width + col corresponde à célula (row, col). Os
+    contadores por linha e coluna continuam a ser listas, pelo que copiar
+    um estado custa apenas alguns inteiros e listas pequenas."""
+
+    def __init__(self, board, rows, columns, hints, fleet=DEFAULT_FLEET):
+        super().__init__(None, rows, columns, hints, fleet)
+        self.row_masks, self.col_masks, self.neighbours = bit_tables(self.height, self.width)
+        self.unknown = (1 << (self.height * self.width)) - 1
+        self.water = 0  # '.'
+        self.hint_water = 0  # 'W'
+        self.fixed = 0  # pistas (maiúsculas), que já não podem ser alteradas
+        self.ship = 0  # todas as peças de barco
+        self.pieces = [0] * len(PIECE_VALUES)  # uma máscara por tipo de peça
+        for r, line in enumerate(board):
+            for c, value in enumerate(line):
+                if value is not None:
+                    self.overlap_value(r, c, value)
+
+    def copy(self):
+        new_board = self.copy_counters()
+        new_board.pieces = self.pieces[:]
+        return new_board
+
+    def in_bounds(self, row, col):
+        return 0 <= row < self.height and 0 <= col < self.width
+
+    def get_value(self, row: int, col: int) -> str:
+        if not self.in_bounds(row, col):
+            return None
+        bit = 1 << (row * self.width + col)
+        if self.unknown & bit:
+            return None
+        if self.water & bit:
+            return '.'
+        if self.hint_water & bit:
+            return 'W'
+        for value, mask in zip(PIECE_VALUES, self.pieces):
+            if mask & bit:
+                return value.upper() if self.fixed & bit else value
+        return None
+
+    def is_cell_empty(self, row, col):
+        return not self.in_bounds(row, col) or bool(self.unknown & (1 << (row * self.width + col)))
+
+    def add_cells(self, name, mask):
+        self.set_attr(name, getattr(self, name) | mask)
+
+    def clear_cells(self, mask):
+        """Retira as células de 'mask' de todas as classes."""
+        keep = ~mask
+        for name in ('unknown', 'water', 'hint_water', 'fixed'):
+            if getattr(self, name) & mask:
+                self.set_attr(name, getattr(self, name) & keep)
+        if self.ship & mask:
+            self.set_attr('ship', self.ship & keep)
+            for piece, piece_mask in enumerate(self.pieces):
+                if piece_mask & mask:
+                    self.set_item(self.pieces, piece, piece_mask & keep)
+
+    def set_cells(self, mask, value):
+        """Escreve 'value' em todas as células de 'mask', sem verificações."""
+        if not mask:
+            return
+        if self.zobrist is not None:
+            for index in iter_bits(mask):
+                self.rehash_cell(*divmod(index, self.width), self.get_value(*divmod(index, self.width)), value)
+        self.clear_cells(mask)
+        if value == '.':
+            self.add_cells('water', mask)
+        elif value == 'W':
+            self.add_cells('hint_water', mask)
+            self.add_cells('fixed', mask)
+        else:
+            piece = PIECE_VALUES.index(value.lower())
+            self.set_item(self.pieces, piece, self.pieces[piece] | mask)
+            self.add_cells('ship', mask)
+            if value.isupper():
+                self.add_cells('fixed', mask)
+
+    def overlap_value(self, row, col, value):
+        self.set_cells(1 << (row * self.width + col), value)
+
+    def change_cell(self, row, col, value):
+        bit = 1 << (row * self.width + col)
+        if self.fixed & bit:
+            return
+        if self.unknown & bit:
+            self.decrease_cell_left(row, col)
+        self.set_cells(bit, value)
+
+    def fill_water(self, mask):
+        """Preenche com água as células por preencher de 'mask'."""
+        mask &= self.unknown
+        if not mask:
+            return
+        for index in iter_bits(mask):
+            self.decrease_cell_left(*divmod(index, self.width))
+        self.set_cells(mask, '.')
+
+    def fill_row_water(self, row):
+        self.steps += self.width
+        self.fill_water(self.row_masks[row])
+        self.clear_row_left(row)
+
+    def fill_col_water(self, col):
+        self.steps += self.height
+        self.fill_water(self.col_masks[col])
+        self.clear_col_left(col)
+
+    def check_adjacencies(self, pos):
+        row, col = pos
+        if not self.in_bounds(row, col):
+            return super().check_adjacencies(pos)
+        index = row * self.width + col
+        return not (self.fixed >> index) & 1 and not self.ship & self.neighbours[index]
+
+    def placement(self, row, col, length, is_vertical):
+        return placement_masks(self.height, self.width, row, col, length, is_vertical)
+
+    def can_place_ship(self, ship):
+        row, col, length, is_vertical = ship[:4]
+        if row < 0 or col < 0:
+            return False
+        if is_vertical is None:
+            if not self.can_fit_col(length, col) or not self.can_fit_row(length, row):
+                return False
+            if not self.in_bounds(row, col):
+                return self.check_adjacencies((row, col))
+        elif is_vertical:
+            if row + length > self.height or not self.can_fit_col(length, col):
+                return False
+            for i in range(row, row + length):
+                if not self.can_fit_row(1, i):
+                    return False
+        else:
+            if col + length > self.width or not self.can_fit_row(length, row):
+                return False
+            for i in range(col, col + length):
+                if not self.can_fit_col(1, i):
+                    return False
+        cells, halo = self.placement(row, col, length, is_vertical)[:2]
+        return not cells & self.fixed and not halo & self.ship
+
+    def place_ship(self, ship):
+        if self.is_overloaded():
+            self.set_attr('wrong', True)
+            return False
+        row, col, length, is_vertical = ship[:4]
+        cells, halo, parts = self.placement(row, col, length, is_vertical)
+        for index in iter_bits((cells | halo) & self.unknown):
+            self.decrease_cell_left(*divmod(index, self.width))
+        writable = ~self.fixed
+        for piece, mask in parts:
+            self.set_cells(mask & writable, PIECE_VALUES[piece])
+        self.set_cells(halo & ~cells & writable, '.')
+        for index in iter_bits(cells):
+            self.decrease_piece_count(*divmod(index, self.width))
+        self.set_item(self.ships, length - 1, self.ships[length - 1] - 1)
+        if self.ships[length - 1] < 0:
+            self.set_attr('wrong', True)
+            return False
+        self.propagate_placement()
+        return True
+
+
+class PlacementCatalog:
+    """Todas as colocações de barcos (row, col, length, is_vertical) que
+    cabem num tabuleiro height x width, até barcos de comprimento max_ship.
+
+    Cada colocação tem um identificador; os identificadores seguem a ordem
+    de Board.free_actions (célula de origem, comprimento, vertical antes de
+    horizontal), pelo que percorrer um conjunto de identificadores por ordem
+    crescente dá as ações pela mesma ordem. Os conjuntos são inteiros com um
+    bit por colocação."""
+
+    def __init__(self, height, width, max_ship):
+        self.placements = []
+        self.cells = []
+        self.halos = []
+        self.first_at = []  # Primeiro identificador com origem em cada célula
+        self.index = {}
+        size = height * width
+        self.ship_kills = [0] * size  # Colocações cuja vizinhança contém a célula
+        self.fixed_kills = [0] * size  # Colocações que ocupam a célula
+        self.length_masks = [0] * (max_ship + 1)
+        self.through = {}  # (célula, orientação) -> colocações que a ocupam
+        for row in range(height):
+            for col in range(width):
+                self.first_at.append(len(self.placements))
+                for length in range(1, max_ship + 1):
+                    for is_vertical in ((None,) if length == 1 else (VERT, HORIZ)):
+                        if (row + length > height) if is_vertical else (col + length > width):
+                            continue
+                        self.add(height, width, (row, col, length, is_vertical))
+        self.first_at.append(len(self.placements))
+        for (index, is_vertical), ids in self.through.items():
+            ids.sort(key=lambda placement_id: self.placements[placement_id][2])
+        for index in range(size):
+            single = self.index[divmod(index, width) + (1, None)]
+            for is_vertical in (VERT, HORIZ):
+                self.through.setdefault((index, is_vertical), []).insert(0, single)
+
+    def add(self, height, width, placement):
+        placement_id = len(self.placements)
+        cells, halo = placement_masks(height, width, *placement)[:2]
+        self.placements.append(placement)
+        self.cells.append(cells)
+        self.halos.append(halo)
+        self.index[placement] = placement_id
+        bit = 1 << placement_id
+        self.length_masks[placement[2]] |= bit
+        for index in iter_bits(halo):
+            self.ship_kills[index] |= bit
+        for index in iter_bits(cells):
+            self.fixed_kills[index] |= bit
+            if placement[2] > 1:
+                self.through.setdefault((index, placement[3]), []).append(placement_id)
+
+
+_catalog_cache = {}
+
+
+def placement_catalog(height, width, max_ship):
+    """Devolve o PlacementCatalog deste tamanho, construído uma única vez."""
+    catalog = _catalog_cache.get((height, width, max_ship))
+    if catalog is None:
+        catalog = PlacementCatalog(height, width, max_ship)
+        _catalog_cache[(height, width, max_ship)] = catalog
+    return catalog
+
+
+class CatalogBoard(BitBoard):
+    """Tabuleiro em máscaras de bits que gera as ações a partir de um
+    PlacementCatalog em vez de percorrer a grelha.
+
+    Cada estado guarda em 'live' o conjunto das colocações que ainda não
+    têm uma pista por baixo nem peças de barco na vizinhança, e as máscaras
+    'ship' e 'fixed' com que esse conjunto foi filtrado. Antes de gerar
+    ações, só as células que passaram a ser barco ou pista desde então são
+    usadas para retirar colocações. Se alguma peça de barco tiver sido
+    substituída por água (o que só acontece em tabuleiros inválidos), o
+    conjunto é calculado de novo."""
+
+    def __init__(self, board, rows, columns, hints, fleet=DEFAULT_FLEET):
+        super().__init__(board, rows, columns, hints, fleet)
+        self.catalog = placement_catalog(self.height, self.width, self.max_ship)
+        self.live = None
+        self.live_ship = 0
+        self.live_fixed = 0
+
+    def live_candidates(self):
+        """Devolve o conjunto 'live', atualizado com as células fixadas
+        desde a última chamada."""
+        catalog, ship, fixed = self.catalog, self.ship, self.fixed
+        if ship == self.live_ship and fixed == self.live_fixed and self.live is not None:
+            return self.live
+        if self.live is None or self.live_ship & ~ship or self.live_fixed & ~fixed:
+            live = 0
+            for placement_id, (cells, halo) in enumerate(zip(catalog.cells, catalog.halos)):
+                if not cells & fixed and not halo & ship:
+                    live |= 1 << placement_id
+        else:
+            killed = 0
+            for index in iter_bits(ship & ~self.live_ship):
+                killed |= catalog.ship_kills[index]
+            for index in iter_bits(fixed & ~self.live_fixed):
+                killed |= catalog.fixed_kills[index]
+            live = self.live & ~killed
+        self.set_attr('live', live)
+        self.set_attr('live_ship', ship)
+        self.set_attr('live_fixed', fixed)
+        return live
+
+    def fits(self, row, col, length, is_vertical):
+        """Verifica as contagens de peças por linha e coluna de uma
+        colocação, como Board.can_place_ship."""
+        if is_vertical:
+            return self.columns[col] >= length and all(self.rows[i] >= 1 for i in range(row, row + length))
+        return self.rows[row] >= length and all(self.columns[i] >= 1 for i in range(col, col + length))
+
+    def can_place_ship(self, ship):
+        placement_id = self.catalog.index.get(ship[:4])
+        if placement_id is None:
+            return super().can_place_ship(ship)
+        return bool(self.live_candidates() >> placement_id & 1) and self.fits(*ship[:4])
+
+    def free_actions(self):
+        catalog = self.catalog
+        start = catalog.first_at[self.lastpos[0] * self.width + self.lastpos[1]]
+        candidates = self.live_candidates() >> start << start
+        lengths = 0
+        for length, amount in enumerate(self.ships, 1):
+            if amount:
+                lengths |= catalog.length_masks[length]
+        actions = []
+        for placement_id in iter_bits(candidates & lengths):
+            placement = catalog.placements[placement_id]
+            row, col = placement[:2]
+            if self.unknown >> (row * self.width + col) & 1 and self.fits(*placement):
+                actions.append(placement + (SHIP_NO_PRIO,))
+        return actions
+
+    def get_actions_with_prio(self, row, col, is_vertical):
+        catalog = self.catalog
+        live = self.live_candidates()
+        ships = []
+        for placement_id in catalog.through[(row * self.width + col, is_vertical)]:
+            placement = catalog.placements[placement_id]
+            if self.ships[placement[2] - 1] and live >> placement_id & 1 and self.fits(*placement):
+                ships.append(placement + (SHIP_PRIO,))
+        return ships
+
+
+CELL_VALUES = (None, '.', 'W', 't', 'b', 'm', 'l', 'r', 'c', 'T', 'B', 'M', 'L', 'R', 'C', None)
+CELL_CODES = {value: code for code, value in enumerate(CELL_VALUES[:-1])}
+BORDER = len(CELL_VALUES) - 1  # Código da moldura de FlatBoard, que não é célula do tabuleiro
+IS_SHIP = bytes(value is not None and value.lower() in PIECE_VALUES for value in CELL_VALUES)
+IS_FIXED = bytes(not can_change_cell(value) for value in CELL_VALUES[:-1]) + b'\x01'
+
+
+class FlatBoard(Board):
+    """Tabuleiro de Bimaru guardado num único bytearray, com uma moldura
+    de uma célula à volta.
+
+    A célula (row, col) está no índice (row + 1) * stride + col + 1, com
+    stride = width + 2, e guarda um código pequeno de CELL_VALUES em vez
+    de uma string. Os vizinhos de uma célula estão a deslocamentos fixos
+    ('offsets', as 8 direções), e a moldura (BORDER) não é barco, pelo que
+    check_adjacencies e os adjacent_*_values não precisam de verificar os
+    limites. As tabelas IS_SHIP e IS_FIXED dizem, por código, se a célula
+    é peça de barco e se já não pode ser alterada."""
+
+    def __init__(self, board, rows, columns, hints, fleet=DEFAULT_FLEET):
+        super().__init__(None, rows, columns, hints, fleet)
+        stride = self.width + 2
+        self.stride = stride
+        self.offsets = (-stride - 1, -stride, -stride + 1, -1, 1, stride - 1, stride, stride + 1)
+        self.cells = bytearray([BORDER]) * ((self.height + 2) * stride)
+        for r, line in enumerate(board):
+            start = (r + 1) * stride + 1
+            self.cells[start:start + self.width] = bytes(CELL_CODES[value] for value in line)
+
+    def copy(self):
+        new_board = self.copy_counters()
+        new_board.cells = self.cells[:]
+        return new_board
+
+    def index(self, row, col):
+        return (row + 1) * self.stride + col + 1
+
+    def get_value(self, row: int, col: int) -> str:
+        if 0 <= row < self.height and 0 <= col < self.width:
+            return CELL_VALUES[self.cells[(row + 1) * self.stride + col + 1]]
+        return None
+
+    def is_cell_empty(self, row, col):
+        return not (0 <= row < self.height and 0 <= col < self.width) or not self.cells[(row + 1) * self.stride + col + 1]
+
+    def adjacent_vertical_values(self, row: int, col: int) -> (str, str):
+        cells, index, stride = self.cells, self.index(row, col), self.stride
+        return CELL_VALUES[cells[index - stride]], CELL_VALUES[cells[index + stride]]
+
+    def adjacent_horizontal_values(self, row: int, col: int) -> (str, str):
+        cells, index = self.cells, self.index(row, col)
+        return CELL_VALUES[cells[index - 1]], CELL_VALUES[cells[index + 1]]
+
+    def adjacent_diagonal_values(self, row: int, col: int) -> (str, str, str, str):
+        cells, index, stride = self.cells, self.index(row, col), self.stride
+        return tuple(CELL_VALUES[cells[index + offset]] for offset in (-stride - 1, -stride + 1, stride - 1, stride + 1))
+
+    def check_adjacencies(self, pos):
+        """Como Board.check_adjacencies, para uma posição do tabuleiro."""
+        cells = self.cells
+        index = (pos[0] + 1) * self.stride + pos[1] + 1
+        if IS_FIXED[cells[index]]:
+            return False
+        for offset in self.offsets:
+            if IS_SHIP[cells[index + offset]]:
+                return False
+        return True
+
+    def change_cell(self, row, col, value):
+        index = (row + 1) * self.stride + col + 1
+        code = self.cells[index]
+        if IS_FIXED[code]:
+            return
+        if not code:
+            self.decrease_cell_left(row, col)
+        self.rehash_cell(row, col, CELL_VALUES[code], value)
+        self.set_item(self.cells, index, CELL_CODES[value])
+
+    def overlap_value(self, row, col, value):
+        index = (row + 1) * self.stride + col + 1
+        self.rehash_cell(row, col, CELL_VALUES[self.cells[index]], value)
+        self.set_item(self.cells, index, CELL_CODES[value])
+
+    def fill_row_water(self, row):
+        self.steps += self.width
+        start = (row + 1) * self.stride + 1
+        for col in range(self.width):
+            if not self.cells[start + col]:
+                self.change_cell(row, col, '.')
+        self.clear_row_left(row)
+
+    def fill_col_water(self, col):
+        self.steps += self.height
+        stride = self.stride
+        for row in range(self.height):
+            if not self.cells[(row + 1) * stride + col + 1]:
+                self.change_cell(row, col, '.')
+        self.clear_col_left(col)
+
+
+BACKENDS = {
+    'list': Board,
+    'bitboard': BitBoard,
+    'catalog': CatalogBoard,
+    'flat': FlatBoard,
+}
+
+PROPAGATIONS = ('rescan', 'worklist')
+BRANCHINGS = ('scan', 'constrained')
+
+
+def h_legacy(board):
+    """A heurística original: células por preencher mais dez vezes as peças
+    de barco por colocar, contadas nas linhas e nas colunas."""
+    return board.cells_left + board.pieces_left * 10
+
+
+def h_ships(board):
+    """Barcos por colocar. Não é admissível: uma ação pode colocar vários
+    barcos de uma vez, pelos barcos forçados que place_guaranteed_ships
+    coloca na propagação, pelo que pode sobrestimar o custo que falta."""
+    return sum(board.ships)
+
+
+def h_segments(board):
+    """Peças de barco (segmentos) ainda por colocar."""
+    return board.pieces_left // 2
+
+
+def fleet_fits(board):
+    """Limite inferior de exequibilidade da frota por colocar: as peças que
+    faltam nas linhas e nas colunas têm de ser as dos barcos por colocar, e
+    o maior barco por colocar tem de caber na contagem de alguma linha ou
+    coluna."""
+    ship_cells = sum(length * amount for length, amount in enumerate(board.ships, 1))
+    if board.pieces_left != 2 * ship_cells:
+        return False
+    longest = max((length for length, amount in enumerate(board.ships, 1) if amount), default=0)
+    return longest <= 1 or max(board.rows) >= longest or max(board.columns) >= longest
+
+
+def h_fleet(board):
+    """h_ships, mas infinita quando fleet_fits mostra que a frota já não
+    cabe, para que a A* deixe esses estados para o fim."""
+    return h_ships(board) if fleet_fits(board) else float('inf')
+
+
+def h_fleet_segments(board):
+    """Peças por colocar mais barcos por colocar, infinita quando a frota
+    já não cabe (ver fleet_fits). Tal como h_ships não é admissível, mas
+    distingue melhor os estados do que as versões anteriores."""
+    if not fleet_fits(board):
+        return float('inf')
+    return h_segments(board) + h_ships(board)
+
+
+HEURISTICS = {
+    'legacy': h_legacy,
+    'ships': h_ships,
+    'segments': h_segments,
+    'fleet': h_fleet,
+    'fleet-segments': h_fleet_segments,
+}
+
+
+def check_option(message, value, choices):
+    """Lança ValueError com 'message' e as opções válidas se 'value' não
+    for uma das 'choices' (um tuplo ou um dicionário como HEURISTICS)."""
+    if value not in choices:
+        raise ValueError("{}: {} (opções: {})".format(message, value, ', '.join(sorted(choices))))
+
+
 class Bimaru(Problem):
-    def __init__(self, board: Board):
-        """O construtor especifica o estado inicial."""
-        super().__init__(BimaruState(board))
+    def __init__(self, board: Board, backend='list', propagation='rescan', heuristic='legacy', branching='scan',
+                 transpositions=0, symmetry=False):
+        """O construtor especifica o estado inicial. 'backend' escolhe a
+        representação do tabuleiro usada na procura (ver BACKENDS),
+        'propagation' o modo de propagação depois de cada ação (ver
+        PROPAGATIONS), 'heuristic' a heurística da procura A* (ver
+        HEURISTICS) e 'branching' como se escolhem as ações (ver
+        BRANCHINGS e constrained_actions).
+
+        Com 'transpositions' > 0, os tabuleiros mantêm um hash de Zobrist
+        e os estados comparam-se pelo conteúdo (ver BimaruState.__eq__);
+        além disso, uma TranspositionTable com esse número de entradas
+        guarda os estados já expandidos e actions() não devolve ações para
+        um estado repetido. 'symmetry' impõe a ordem canónica dos barcos
+        (ver canonical)."""
+        check_option("Modo de ramificação desconhecido", branching, BRANCHINGS)
+        check_option("Heurística desconhecida", heuristic, HEURISTICS)
+        check_option("Representação do tabuleiro desconhecida", backend, BACKENDS)
+        check_option("Modo de propagação desconhecido", propagation, PROPAGATIONS)
+        self.heuristic = HEURISTICS[heuristic]
+        self.backend = backend
+        self.branching = branching
+        self.symmetry = symmetry
+        self.branching_factors = Counter()  # Número de ações -> nós com esse número de ações
+        board_cls = BACKENDS[backend]
+        if type(board) is not board_cls:
+            board = board_cls.from_board(board)
+        if board.propagation != propagation:
+            board = board.copy()
+            board.propagation = propagation
+        self.table = None
+        if transpositions:
+            self.table = TranspositionTable(transpositions)
+            if board.zobrist is None:
+                board = board.copy()
+                board.enable_hashing()
+        self.state_ids = itertools.count()
+        super().__init__(self.new_state(board))
         self.count = 0
+        # Passos de propagação (células examinadas) por ação aplicada: número de ações, total e máximo
+        self.propagated_actions = 0
+        self.propagation_steps = 0
+        self.max_propagation_steps = 0
+
+    def new_state(self, board):
+        """Cria um estado com o próximo identificador deste problema, que
+        serve de desempate na fila de prioridade da procura A*."""
+        return BimaruState(board, next(self.state_ids))
 
     def actions(self, state: BimaruState):
         """Retorna uma lista de ações que podem ser executadas a
         partir do estado passado como argumento."""
         board = state.board
+        if self.table is not None and not board.wrong and self.table.seen(board.state_key()):
+            self.branching_factors[0] += 1
+            return []
+        if self.branching == 'constrained':
+            actions = self.constrained_actions(state.board)
+        else:
+            actions = self.scan_actions(state.board)
+        self.branching_factors[len(actions)] += 1
+        return actions
+
+    def scan_actions(self, board):
+        """Ramificação original: a primeira pista, senão a primeira linha ou
+        coluna forçada, senão os barcos a partir de lastpos."""
         if board.wrong:
             return []
-        actions = []
-        for i in range(MAX_LENGTH):
-            if board.rows[i] > board.cells_left_row[i] or board.columns[i] > board.cells_left_col[i]:
-                return []
+        if board.is_overloaded():
+            return []
 
         if board.hints:
             return self.hint_actions(board)
 
-        for i in range(MAX_LENGTH):
-            if board.rows[i] == board.cells_left_row[i] != 0:
-                return board.find_next_guaranteed_ship(i, HORIZ)
-            if board.columns[i] == board.cells_left_col[i] != 0:
-                return board.find_next_guaranteed_ship(i, VERT)
-
-        row = board.lastpos[0]
-        col = board.lastpos[1]
-        for row in range(row, MAX_LENGTH):
-            for col in range(col, MAX_LENGTH):
-                if board.is_cell_empty(row, col):
-                    for ship_len, amount in enumerate(board.ships):
-                        if amount == 0:
-                            continue
-                        ship_len += 1
-                        if ship_len < 1:
-                            continue
-                        if ship_len == 1:
-                            board.add_ship(row, col, ship_len, None, actions, SHIP_NO_PRIO)
-                            continue
-                        board.add_ship(row, col, ship_len, VERT, actions, SHIP_NO_PRIO)
-                        board.add_ship(row, col, ship_len, HORIZ, actions, SHIP_NO_PRIO)
-            col = 0
-        return actions
-
-    def hint_actions(self,
-                     board):
+        for i in range(max(board.height, board.width)):
+            if i < board.height and board.rows[i] == board.cells_left_row[i] != 0:
+                return self.canonical(board, board.find_next_guaranteed_ship(i, HORIZ))
+            if i < board.width and board.columns[i] == board.cells_left_col[i] != 0:
+                return self.canonical(board, board.find_next_guaranteed_ship(i, VERT))
+
+        return board.free_actions()
+
+    def canonical(self, board, actions):
+        """Com 'symmetry', retira as colocações cuja célula de origem vem
+        antes de lastpos.
+
+        As ações SHIP_NO_PRIO já colocam os barcos livres por ordem de
+        origem, mas um barco anterior a lastpos ainda podia ser colocado
+        depois por uma linha forçada, o que dava o mesmo conjunto de barcos
+        por outra ordem. Com a regra de que todos os barcos por colocar têm
+        origem em lastpos ou depois, cada disposição só é gerada pela ordem
+        canónica: o barco por colocar com a menor origem é sempre uma das
+        ações livres, pelo que nenhuma solução se perde."""
+        if not self.symmetry or not actions:
+            return actions
+        return [action for action in actions if (action[0], action[1]) >= board.lastpos]
+
+    def constrained_actions(self, board):
+        """Ramificação pela restrição mais apertada. Com pistas por aplicar,
+        escolhe a pista com menos ações. Senão escolhe a linha ou coluna
+        com menos folga entre as células por preencher e as peças que
+        faltam; se a folga for 0 a linha está forçada, senão ramifica sobre
+        a sua primeira célula vazia: cada barco que a ocupa, do mais
+        comprido (o que falha mais cedo) para o mais curto, e por fim água.
+        Estas ações são uma partição, pelo que cada solução é encontrada
+        uma única vez."""
+        if board.wrong or board.is_overloaded():
+            return []
+        if board.hints:
+            return min((self.hint_actions(board, hint) for hint in board.hints), key=len)
+
+        best = None
+        for i in range(board.height):
+            if board.rows[i]:
+                best = min(best or (float('inf'),), (board.cells_left_row[i] - board.rows[i], i, HORIZ))
+        for i in range(board.width):
+            if board.columns[i]:
+                best = min(best or (float('inf'),), (board.cells_left_col[i] - board.columns[i], i, VERT))
+        if best is None:
+            return []
+        slack, line, is_vertical = best
+        if slack == 0:
+            return board.find_next_guaranteed_ship(line, is_vertical)
+        index = board.find_empty_space(line, 0, is_vertical)
+        if index is None:
+            return []
+        row, col = (index, line) if is_vertical else (line, index)
+        ships = board.get_actions_with_prio(row, col, VERT)
+        ships += [ship for ship in board.get_actions_with_prio(row, col, HORIZ) if ship[2] > 1]
+        ships = [ship for ship in ships if all(board.is_cell_empty(*cell) for cell in ship_cells(*ship[:4]))]
+        ships.sort(key=lambda ship: -ship[2])
+        return ships + [(row, col, '.', None, WATER)]
+
+    def hint_actions(self, board, hint=None):
+        """Ações que aplicam a pista 'hint' (por omissão, a primeira). Se
+        'hint' for dada, cada ação leva-a no fim, para que apply retire essa
+        pista e não a primeira."""
+        tag = () if hint is None else (hint,)
         actions = []
         adjust_coords = {
             'T': (0, 0, VERT),
@@ -491,19 +1478,17 @@ class Bimaru(Problem):
             'R': (0, -1, HORIZ),
             'C': (0, 0, None)
         }
-        hint = board.hints[0]
-        row, col, value = hint
+        row, col, value = hint or board.hints[0]
         if value == "M":
-            for ship_len, amount in enumerate(board.ships[2:], start=2):
+            for length, amount in enumerate(board.ships[2:], start=3):
                 if amount == 0:
                     continue
-                board.add_ship(row - ship_len + 1, col, ship_len + 1, VERT, actions, HINT)
-                board.add_ship(row, col - ship_len + 1, ship_len + 1, HORIZ, actions, HINT)
-                if ship_len > 2:
-                    board.add_ship(row - ship_len + 2, col, ship_len + 1, VERT, actions, HINT)
-                    board.add_ship(row, col - ship_len - 2, ship_len + 1, HORIZ, actions, HINT)
+                # O M pode ser qualquer peça do meio, da penúltima à segunda
+                for index in range(length - 2, 0, -1):
+                    board.add_ship(row - index, col, length, VERT, actions, HINT)
+                    board.add_ship(row, col - index, length, HORIZ, actions, HINT)
         elif value == 'W':
-            return [(row, col, value, None, HINT_OVERLAP)]
+            return [(row, col, value, None, HINT_OVERLAP) + tag]
         else:
             if value == 'C':
                 ships = board.ships[:1]
@@ -517,35 +1502,57 @@ class Bimaru(Problem):
                 setup = adjust_coords[value]
                 board.add_ship(row + setup[0] * ship_len, col + setup[1] * ship_len, ship_len + 1, setup[2], actions,
                                HINT)
-            if not actions:
-                if board.get_value(row, col) is not None and board.get_value(row, col).upper() == value:
-                    actions.append((row, col, value, None, HINT_OVERLAP))
-        return actions
+        if not actions:
+            # A pista já pode estar coberta por um barco colocado antes
+            if board.get_value(row, col) is not None and board.get_value(row, col).upper() == value:
+                actions.append((row, col, value, None, HINT_OVERLAP))
+        return [action + tag for action in actions] if tag else actions
 
     def result(self, state: BimaruState, action):
         """Retorna o estado resultante de executar a 'action' sobre
         'state' passado como argumento. A ação a executar deve ser uma
         das presentes na lista obtida pela execução de
         self.actions(state)."""
-        new_board = copy.deepcopy(state.board)
+        new_board = state.board.copy()
+        self.apply(new_board, action)
+        new_state = self.new_state(new_board)
+
+        return new_state  # criar o estado updated
+
+    def apply(self, board, action):
+        """Executa 'action' diretamente sobre 'board', sem o copiar."""
+        steps = board.steps
+        worklist = board.propagation == 'worklist'
+        if worklist:
+            board.start_propagation()
         if action[4] == HINT_OVERLAP:
-            if action[2] == 'W' and new_board.get_value(action[0], action[1]) is None:
-                new_board.decrease_cell_left(action[0], action[1])
-            new_board.overlap_value(action[0], action[1], action[2])
-            new_board.hints.pop(0)
+            if action[2] == 'W' and board.get_value(action[0], action[1]) is None:
+                board.decrease_cell_left(action[0], action[1])
+            board.overlap_value(action[0], action[1], action[2])
+            board.pop_hint(*action[5:])
+            if worklist:
+                board.propagate()
+
+        elif action[4] == WATER:
+            board.change_cell(action[0], action[1], '.')
+            board.propagate_placement()
+            if worklist:
+                board.propagate()
 
         else:
-            new_board.place_ship(action)  # por os ships na new board
+            board.place_ship(action)  # por os ships na board
+            if worklist:
+                board.propagate()
 
             if action[4] == HINT:
-                row, col, val = new_board.hints.pop(0)
-                new_board.overlap_value(row, col, val)
+                row, col, val = board.pop_hint(*action[5:])
+                board.overlap_value(row, col, val)
             elif action[4] == SHIP_NO_PRIO:
-                new_board.lastpos = (action[0], action[1])
-
-        new_state = BimaruState(new_board)
-
-        return new_state  # criar o estado updated
+                board.set_attr('lastpos', (action[0], action[1]))
+        steps = board.steps - steps
+        self.propagated_actions += 1
+        self.propagation_steps += steps
+        self.max_propagation_steps = max(self.max_propagation_steps, steps)
 
     def goal_test(self, state: BimaruState):
         """Retorna True se e só se o estado passado como argumento é
@@ -555,27 +1562,1265 @@ class Bimaru(Problem):
         return all(ship_amount == 0 for ship_amount in board.ships)
 
     def h(self, node: Node):
-        """Função heuristica utilizada para a procura A*."""
-        board = node.state.board
-
-        cells_left = sum(board.cells_left_row) + sum(board.cells_left_col)
-
-        unplaced_ships = (sum(board.rows) + sum(board.columns)) * 10
-
-        heuristic = cells_left + unplaced_ships
+        """Função heuristica utilizada para a procura A*. Os totais de que
+        as heurísticas precisam são mantidos pelo tabuleiro a cada
+        alteração, pelo que não se percorrem as linhas e colunas."""
+        return self.heuristic(node.state.board)
+
+
+def load_instance(path):
+    """Lê a instância guardada no ficheiro 'path'."""
+    with open(path) as instance:
+        return Board.parse_instance(instance)
+
+
+DIAGONALS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+# Células (drow, dcol) que ficam com água à volta de cada pista, seja qual for o barco que a cobre
+HINT_WATER = {
+    'T': DIAGONALS + ((-1, 0), (0, -1), (0, 1)),
+    'B': DIAGONALS + ((1, 0), (0, -1), (0, 1)),
+    'L': DIAGONALS + ((0, -1), (-1, 0), (1, 0)),
+    'R': DIAGONALS + ((0, 1), (-1, 0), (1, 0)),
+    'C': DIAGONALS + ((-1, 0), (1, 0), (0, -1), (0, 1)),
+    'M': DIAGONALS,
+    'W': (),
+}
+
+
+def hint_water(board, row, col, value):
+    """Células vizinhas da pista (row, col, value) que são água em
+    qualquer solução. Um M na primeira ou na última linha só pode ser de
+    um barco horizontal, e na primeira ou na última coluna de um
+    vertical, pelo que as células dos outros lados também são água."""
+    cells = list(HINT_WATER[value])
+    if value == 'M':
+        if row in (0, board.height - 1):
+            cells += [(-1, 0), (1, 0)]
+        if col in (0, board.width - 1):
+            cells += [(0, -1), (0, 1)]
+    return [(row + drow, col + dcol) for drow, dcol in cells
+            if 0 <= row + drow < board.height and 0 <= col + dcol < board.width]
+
+
+def deduce_hints(board):
+    """Aplica a 'board' (um tabuleiro acabado de ler) as deduções que as
+    pistas permitem sem procurar: primeiro a água à volta de cada pista
+    (ver hint_water), depois, até ao ponto fixo, as pistas com uma única
+    ação possível (as W, um C, um T que só cabe num comprimento...), com
+    Bimaru.apply, que também propaga o preenchimento de água e os barcos
+    forçados das linhas e colunas.
+
+    Cada pista aplicada é um nível a menos na árvore de procura. Devolve
+    um dicionário com 'hints' (pistas lidas), 'applied' (pistas aplicadas,
+    ou seja, a profundidade retirada à procura), 'water' (células marcadas
+    como água à volta das pistas) e 'ships' (barcos colocados)."""
+    backend = next(name for name, cls in BACKENDS.items() if cls is type(board))
+    problem = Bimaru(board, backend, board.propagation)
+    hints, ships = len(board.hints), sum(board.ships)
+    positions = {(row, col) for row, col, _ in board.hints}
+    water = 0
+    for row, col, value in board.hints:
+        for cell in hint_water(board, row, col, value):
+            if cell not in positions and board.get_value(*cell) is None:
+                board.change_cell(*cell, '.')
+                water += 1
+    applied, changed = 0, True
+    while changed and board.hints and not board.wrong:
+        changed = False
+        for hint in list(board.hints):
+            actions = problem.hint_actions(board, hint)
+            if len(actions) == 1:
+                problem.apply(board, actions[0])
+                applied += 1
+                changed = True
+                if board.wrong:
+                    break
+    return {'hints': hints, 'applied': applied, 'water': water, 'ships': ships - sum(board.ships)}
+
+
+HINT_VALUES = 'TBMLRCW'
+
+
+class InstanceError(ValueError):
+    """Bloco mal formado num ficheiro de instâncias. 'offset' é a posição,
+    em bytes desde o início do ficheiro, da linha com o erro."""
+
+    def __init__(self, offset, message):
+        super().__init__('byte {}: {}'.format(offset, message))
+        self.offset = offset
+
+
+def instance_lines(source, use_mmap=False):
+    """Gera os pares (posição em bytes, linha) de 'source': o caminho de
+    um ficheiro, um ficheiro binário ou um ficheiro de texto (como o
+    stdin). Com 'use_mmap', um caminho é lido através de um mmap."""
+    if isinstance(source, str):
+        with open(source, 'rb') as file:
+            if use_mmap and os.fstat(file.fileno()).st_size:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    yield from instance_lines(mapped)
+            else:
+                yield from instance_lines(file)
+        return
+    offset = 0
+    while True:
+        line = source.readline()
+        if not line:
+            return
+        if isinstance(line, str):
+            yield offset, line
+            offset += len(line.encode())
+        else:
+            yield offset, line.decode(errors='replace')
+            offset += len(line)
+
+
+def instance_blocks(lines):
+    """Agrupa as linhas não vazias em blocos, um por instância: cada linha
+    ROW começa um bloco novo. Gera listas de pares (posição, palavras)."""
+    block = []
+    for offset, line in lines:
+        words = line.split()
+        if not words:
+            continue
+        if words[0] == 'ROW' and block:
+            yield block
+            block = []
+        block.append((offset, words))
+    if block:
+        yield block
+
+
+def instance_numbers(line, keyword):
+    offset, words = line
+    if words[0] != keyword:
+        raise InstanceError(offset, 'esperava {}, encontrou {}'.format(keyword, words[0]))
+    try:
+        return [int(word) for word in words[1:]]
+    except ValueError:
+        raise InstanceError(offset, 'valor que não é inteiro em {}'.format(keyword)) from None
+
+
+def parse_block(block):
+    """Constrói o tabuleiro de um bloco de instance_blocks, ou lança
+    InstanceError se o bloco estiver mal formado."""
+    rows = instance_numbers(block[0], 'ROW')
+    if len(block) < 3:
+        raise InstanceError(block[-1][0], 'instância incompleta')
+    columns = instance_numbers(block[1], 'COLUMN')
+    fleet, index = DEFAULT_FLEET, 2
+    if block[2][1][0] == 'FLEET':
+        fleet, index = instance_numbers(block[2], 'FLEET'), 3
+    if index >= len(block):
+        raise InstanceError(block[-1][0], 'instância incompleta')
+    offset, words = block[index]
+    if len(words) != 1 or not words[0].isdigit():
+        raise InstanceError(offset, 'esperava o número de pistas, encontrou {}'.format(' '.join(words)))
+    if len(block) - index - 1 != int(words[0]):
+        raise InstanceError(offset, '{} pistas anunciadas, {} encontradas'.format(words[0], len(block) - index - 1))
+    hints = []
+    for offset, words in block[index + 1:]:
+        if (len(words) != 4 or words[0] != 'HINT' or not words[1].isdigit() or not words[2].isdigit()
+                or len(words[3]) != 1 or words[3] not in HINT_VALUES):
+            raise InstanceError(offset, 'pista inválida: {}'.format(' '.join(words)))
+        row, col = int(words[1]), int(words[2])
+        if row >= len(rows) or col >= len(columns):
+            raise InstanceError(offset, 'pista fora do tabuleiro: {}'.format(' '.join(words)))
+        hints.append((row, col, words[3]))
+    return Board.from_instance(rows, columns, hints, fleet)
+
+
+def parse_instances(source, use_mmap=False, on_error=None):
+    """Lê de 'source' (ver instance_lines) as instâncias concatenadas e
+    gera-as uma a uma como Boards, guardando em memória só a instância a
+    ler.
+
+    Cada instância tem o formato de Board.parse_instance e as linhas em
+    branco são ignoradas. Num bloco mal formado lança InstanceError ou,
+    se 'on_error' for dado, chama on_error(erro) e passa à instância
+    seguinte."""
+    for block in instance_blocks(instance_lines(source, use_mmap)):
+        try:
+            board = parse_block(block)
+        except InstanceError as error:
+            if on_error is None:
+                raise
+            on_error(error)
+            continue
+        yield board
+
+
+NO_SOLUTION = "There is no solution available. Better luck next time :)"
+SOLUTION_CODES = '-.WtbmlrcTBMLRC'  # Valor de cada código de 4 bits do formato binário
+
+
+def encode_solution(board):
+    """Codifica a solução 'board' (None se não houver solução) no formato
+    binário: um byte com a altura, um com a largura e as células em
+    códigos de 4 bits (SOLUTION_CODES), duas por byte, a mais alta
+    primeiro. Sem solução, altura e largura são 0."""
+    if board is None:
+        return bytes(2)
+    codes = [SOLUTION_CODES.index(value) for line in board.solution_lines() for value in line]
+    if len(codes) % 2:
+        codes.append(0)
+    return bytes([board.height, board.width]) + bytes(codes[i] << 4 | codes[i + 1] for i in range(0, len(codes), 2))
+
+
+def read_solutions(stream):
+    """Gera as soluções escritas por encode_solution em 'stream' (um
+    ficheiro binário), como strings iguais às de Board.solution_string,
+    ou None para as instâncias sem solução."""
+    while True:
+        header = stream.read(2)
+        if len(header) < 2:
+            return
+        height, width = header
+        data = stream.read((height * width + 1) // 2)
+        codes = [SOLUTION_CODES[byte >> shift & 15] for byte in data for shift in (4, 0)]
+        yield '\n'.join(''.join(codes[r * width:(r + 1) * width]) for r in range(height)) if height else None
+
+
+class SolutionWriter:
+    """Escreve soluções num ficheiro binário (por exemplo
+    sys.stdout.buffer) em bloco: cada solução é acrescentada a um
+    bytearray, que só é escrito quando passa de 'flush_size' bytes, em
+    flush() ou à saída do bloco with.
+
+    Em texto, cada solução sai como em Board.print_solution (ou com a
+    mensagem NO_SOLUTION) e as soluções são separadas por uma linha em
+    branco; com 'binary' usa-se o formato de encode_solution."""
+
+    def __init__(self, stream, binary=False, flush_size=1 << 16):
+        self.stream = stream
+        self.binary = binary
+        self.flush_size = flush_size
+        self.buffer = bytearray()
+        self.count = 0
 
-        return heuristic
+    def write(self, board):
+        buffer = self.buffer
+        if self.binary:
+            buffer += encode_solution(board)
+        else:
+            if self.count:
+                buffer += b'\n'
+            lines = [NO_SOLUTION] if board is None else board.solution_lines()
+            for line in lines:
+                buffer += line.encode()
+                buffer += b'\n'
+        self.count += 1
+        if len(buffer) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        self.stream.write(self.buffer)
+        self.stream.flush()
+        del self.buffer[:]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+
+SOLUTION_CACHE_SIZE = 100000  # Entradas por omissão de SolutionCache
+# Simetrias do tabuleiro: (transpõe, inverte a ordem das linhas, inverte a ordem das colunas), por esta ordem
+SYMMETRIES = tuple(itertools.product((False, True), repeat=3))
+TRANSPOSE_PIECES = str.maketrans('tblrTBLR', 'lrtbLRTB')
+FLIP_ROWS_PIECES = str.maketrans('tbTB', 'btBT')
+FLIP_COLUMNS_PIECES = str.maketrans('lrLR', 'rlRL')
+
+
+def transform_instance(rows, columns, hints, symmetry):
+    """Aplica a simetria 'symmetry' (ver SYMMETRIES) a uma instância e
+    devolve as novas (rows, columns, hints). As peças das pistas mudam
+    com a orientação: ao transpor, T passa a L e B a R."""
+    transpose, flip_rows, flip_columns = symmetry
+    rows, columns, hints = list(rows), list(columns), list(hints)
+    if transpose:
+        rows, columns = columns, rows
+        hints = [(col, row, value.translate(TRANSPOSE_PIECES)) for row, col, value in hints]
+    if flip_rows:
+        rows.reverse()
+        hints = [(len(rows) - 1 - row, col, value.translate(FLIP_ROWS_PIECES)) for row, col, value in hints]
+    if flip_columns:
+        columns.reverse()
+        hints = [(row, len(columns) - 1 - col, value.translate(FLIP_COLUMNS_PIECES)) for row, col, value in hints]
+    return rows, columns, hints
+
+
+def transform_solution(lines, symmetry, inverse=False):
+    """Aplica a simetria 'symmetry' às linhas de uma solução (como as de
+    Board.solution_lines) ou, com 'inverse', desfaz-a. Cada passo é a sua
+    própria inversa, pelo que desfazer é aplicar os passos pela ordem
+    contrária."""
+    transpose, flip_rows, flip_columns = symmetry
+    steps = [transpose, flip_rows, flip_columns]
+    for step in (reversed(range(3)) if inverse else range(3)):
+        if not steps[step]:
+            continue
+        if step == 0:
+            lines = [''.join(column).translate(TRANSPOSE_PIECES) for column in zip(*lines)]
+        elif step == 1:
+            lines = [line.translate(FLIP_ROWS_PIECES) for line in reversed(lines)]
+        else:
+            lines = [line[::-1].translate(FLIP_COLUMNS_PIECES) for line in lines]
+    return list(lines)
+
+
+def instance_fingerprint(board):
+    """Devolve (chave, simetria): a chave identifica a instância de 'board'
+    (contagens, pistas e frota) a menos das 8 simetrias do tabuleiro, e
+    'simetria' leva a instância à forma canónica, a menor das 8 formas
+    escritas em texto, de onde vem a chave."""
+    forms = []
+    for symmetry in SYMMETRIES:
+        rows, columns, hints = transform_instance(board.rows, board.columns, board.hints, symmetry)
+        forms.append(('{} {} {} {}'.format(rows, columns, sorted(hints), list(board.ships)), symmetry))
+    text, symmetry = min(forms)
+    return hashlib.sha256(text.encode()).hexdigest(), symmetry
+
+
+def solved_board(lines, board):
+    """Tabuleiro resolvido com as células 'lines' (strings ou listas de
+    valores), do tamanho de 'board', como o de um estado objetivo: sem
+    peças, células, barcos nem pistas por colocar."""
+    solved = Board([list(line) for line in lines], [0] * board.height, [0] * board.width, [],
+                   [0] * board.max_ship)
+    solved.cells_left_row = [0] * board.height
+    solved.cells_left_col = [0] * board.width
+    solved.count_totals()
+    return solved
+
+
+class SolutionCache:
+    """Cache persistente de soluções, num ficheiro SQLite, indexada pela
+    chave de instance_fingerprint. As soluções guardam-se na forma
+    canónica, pelo que uma instância transposta ou espelhada de outra já
+    resolvida também é encontrada, e a solução é devolvida depois de
+    desfeita a simetria. Também se guardam as instâncias sem solução.
+
+    Cada entrada tem o instante do último uso; ao passar de 'max_entries'
+    entradas, as usadas há mais tempo são removidas (LRU). Vários
+    processos podem usar o mesmo ficheiro ao mesmo tempo."""
+
+    def __init__(self, path, max_entries=SOLUTION_CACHE_SIZE):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path, timeout=60)
+        with self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS solutions '
+                                    '(key TEXT PRIMARY KEY, solution TEXT, used INTEGER NOT NULL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS solutions_used ON solutions (used)')
+
+    def next_use(self):
+        return self.connection.execute('SELECT COALESCE(MAX(used), 0) + 1 FROM solutions').fetchone()[0]
+
+    def get(self, board):
+        """Devolve (encontrada, solução): se a instância de 'board' está na
+        cache, (True, tabuleiro resolvido ou None se não tem solução);
+        senão (False, None)."""
+        key, symmetry = instance_fingerprint(board)
+        with self.connection:
+            row = self.connection.execute('SELECT solution FROM solutions WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return False, None
+            self.connection.execute('UPDATE solutions SET used = ? WHERE key = ?', (self.next_use(), key))
+        self.hits += 1
+        if row[0] is None:
+            return True, None
+        return True, solved_board(transform_solution(row[0].split('\n'), symmetry, inverse=True), board)
+
+    def put(self, board, solution):
+        """Guarda 'solution' (tabuleiro resolvido ou None) como a solução
+        da instância de 'board' e remove as entradas a mais."""
+        key, symmetry = instance_fingerprint(board)
+        text = None if solution is None else '\n'.join(transform_solution(solution.solution_lines(), symmetry))
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO solutions VALUES (?, ?, ?)',
+                                    (key, text, self.next_use()))
+            self.connection.execute('DELETE FROM solutions WHERE key IN '
+                                    '(SELECT key FROM solutions ORDER BY used DESC LIMIT -1 OFFSET ?)',
+                                    (self.max_entries,))
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM solutions').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def depth_first_trail_search(problem):
+    """Procura em profundidade sobre um único tabuleiro partilhado.
+
+    Em vez de copiar o tabuleiro para cada sucessor, aplica cada ação com
+    Bimaru.apply e, ao recuar, desfaz as alterações registadas no trail do
+    tabuleiro. Explora as ações pela mesma ordem que depth_first_tree_search,
+    pelo que devolve a mesma solução. Só o nó final tem estado; os nós
+    intermédios do caminho guardam apenas a ação."""
+    board = problem.initial.board.copy()
+    board.trail = []
+    state = problem.new_state(board)
+    if problem.goal_test(state):
+        board.trail = None
+        return Node(state)
+    stack = [(board.mark(), reversed(problem.actions(state)))]
+    path = []
+    while stack:
+        mark, actions = stack[-1]
+        board.undo(mark)
+        del path[len(stack) - 1:]
+        action = next(actions, None)
+        if action is None:
+            stack.pop()
+            continue
+        problem.apply(board, action)
+        path.append(action)
+        if problem.goal_test(state):
+            board.trail = None
+            node = Node(problem.initial)
+            for action in path:
+                node = Node(None, node, action, problem.path_cost(node.path_cost, None, action, None))
+            node.state = state
+            return node
+        stack.append((board.mark(), reversed(problem.actions(state))))
+    board.trail = None
+    return None
+
+
+PARALLEL_SPLIT_DEPTH = 2  # Níveis da raiz expandidos antes de distribuir as subárvores
+PARALLEL_CHECK_EVERY = 64  # Nós expandidos por um worker entre verificações de paragem e de partilha
+PARALLEL_POLL_INTERVAL = 0.5  # Segundos entre verificações dos workers enquanto se espera por resultados
+
+
+class WorkerError(RuntimeError):
+    """Um processo worker terminou (erro, falta de memória, sinal) sem
+    entregar o seu trabalho."""
+
+
+def worker_result(results, processes):
+    """Tira o próximo resultado de 'results', a fila dos workers
+    'processes'. Em vez de esperar sem limite, verifica de
+    PARALLEL_POLL_INTERVAL em PARALLEL_POLL_INTERVAL segundos se algum
+    worker terminou com erro ou se já terminaram todos, e nesse caso
+    lança WorkerError: o que lhes faltava entregar perdeu-se."""
+    while True:
+        try:
+            return results.get(timeout=PARALLEL_POLL_INTERVAL)
+        except queue.Empty:
+            failed = [process.exitcode for process in processes if process.exitcode not in (None, 0)]
+            if failed or all(process.exitcode is not None for process in processes):
+                try:
+                    # O que um worker pôs na fila antes de terminar já está lá
+                    return results.get(timeout=PARALLEL_POLL_INTERVAL)
+                except queue.Empty:
+                    raise WorkerError("worker terminou sem entregar o resultado (exit codes {})".format(
+                        [process.exitcode for process in processes])) from None
+
+
+def parallel_worker(options, tasks, results, stop, pending, idle, nodes):
+    """Worker de parallel_depth_first_search. Tira de 'tasks' tabuleiros
+    serializados e percorre cada subárvore em profundidade com
+    Bimaru.result, pela ordem de depth_first_tree_search.
+
+    De PARALLEL_CHECK_EVERY em PARALLEL_CHECK_EVERY nós verifica 'stop' e,
+    se houver workers à espera ('idle') e a fila estiver vazia, cede-lhes
+    os estados do fundo da sua pilha, que são as maiores subárvores por
+    explorar. 'pending' conta as subárvores por acabar; quem o põe a zero
+    avisa o processo principal com None em 'results'. Uma solução é posta
+    em 'results' serializada."""
+    backend, propagation, branching, symmetry = options
+    board_cls = BACKENDS[backend]
+    tasks.cancel_join_thread()  # Só se sai depois de 'stop': as tarefas por tirar já não interessam
+    expanded = 0
+    while not stop.is_set():
+        with idle.get_lock():
+            idle.value += 1
+        try:
+            data = tasks.get(timeout=0.05)
+        except queue.Empty:
+            continue
+        finally:
+            with idle.get_lock():
+                idle.value -= 1
+        board = board_cls.from_bytes(data)
+        board.propagation = propagation
+        problem = Bimaru(board, backend, propagation, branching=branching, symmetry=symmetry)
+        stack = [problem.initial]
+        while stack:
+            state = stack.pop()
+            if problem.goal_test(state):
+                results.put(state.board.to_bytes())
+                stop.set()
+                break
+            stack.extend(problem.result(state, action) for action in problem.actions(state))
+            expanded += 1
+            if expanded % PARALLEL_CHECK_EVERY == 0:
+                if stop.is_set():
+                    break
+                shared = min(idle.value, len(stack) - 1)
+                if shared > 0 and tasks.empty():
+                    with pending.get_lock():
+                        pending.value += shared
+                    for state in stack[:shared]:
+                        tasks.put(state.board.to_bytes())
+                    del stack[:shared]
+        with pending.get_lock():
+            pending.value -= 1
+            if pending.value == 0:
+                results.put(None)
+    with nodes.get_lock():
+        nodes.value += expanded
+
+
+def parallel_depth_first_search(problem, workers=None, split_depth=PARALLEL_SPLIT_DEPTH):
+    """Procura em profundidade repartida por 'workers' processos (por
+    omissão, um por núcleo).
+
+    O processo principal expande a raiz até 'split_depth' níveis e põe as
+    subárvores numa fila, pela ordem em que a DFS as visitaria; os workers
+    (ver parallel_worker) tiram-nas da fila e partilham a sua pilha com os
+    que ficarem sem trabalho. Os tabuleiros passam entre processos
+    serializados com Board.to_bytes. A primeira solução encontrada pára
+    todos os workers, pelo que não é necessariamente a da DFS sequencial.
+    Os nós expandidos pelos workers somam-se a problem.succs. Se um worker
+    morrer sem entregar a sua parte, lança WorkerError (ver worker_result)."""
+    level = [problem.initial]
+    for _ in range(split_depth):
+        children = []
+        for state in level:
+            if problem.goal_test(state):
+                return Node(state)
+            children.extend(reversed([problem.result(state, action) for action in problem.actions(state)]))
+        level = children
+    for state in level:
+        if problem.goal_test(state):
+            return Node(state)
+    if not level:
+        return None
+    board = problem.initial.board
+    options = (problem.backend, board.propagation, problem.branching, problem.symmetry)
+    tasks, results = multiprocessing.Queue(), multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    pending = multiprocessing.Value('i', len(level))
+    idle = multiprocessing.Value('i', 0)
+    nodes = multiprocessing.Value('q', 0)
+    for state in level:
+        tasks.put(state.board.to_bytes())
+    processes = [multiprocessing.Process(target=parallel_worker, daemon=True,
+                                         args=(options, tasks, results, stop, pending, idle, nodes))
+                 for _ in range(workers or os.cpu_count())]
+    for process in processes:
+        process.start()
+    try:
+        data = worker_result(results, processes)
+    finally:
+        stop.set()
+        tasks.cancel_join_thread()
+        for process in processes:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+    if isinstance(problem, InstrumentedProblem):
+        problem.succs += nodes.value
+    if data is None:
+        return None
+    return Node(problem.new_state(type(board).from_bytes(data)))
+
+
+COUNT_CACHE_SIZE = 1 << 18  # Entradas da tabela de subárvores esgotadas de enumerate_solutions
+
+
+def enumerate_solutions(problem, table=None):
+    """Gera os tabuleiros de todos os estados objetivo da árvore de procura
+    de 'problem', em profundidade e sobre um tabuleiro partilhado, como
+    depth_first_trail_search, mas sem parar no primeiro.
+
+    Quando todas as ações de um estado foram percorridas, a chave do
+    estado (Board.state_key) vai para 'table' (por omissão, uma
+    TranspositionTable de COUNT_CACHE_SIZE entradas), e um estado igual
+    encontrado depois já não é expandido: ou a sua subárvore não tem
+    soluções ou as que tem já foram geradas. A mesma disposição pode ser
+    gerada mais do que uma vez por caminhos diferentes; quem conta deve
+    comparar as soluções."""
+    table = table if table is not None else TranspositionTable(COUNT_CACHE_SIZE)
+    board = problem.initial.board.copy()
+    if board.zobrist is None:
+        board.enable_hashing()
+    board.trail = []
+    state = problem.new_state(board)
+
+    def solution():
+        trail, board.trail = board.trail, None
+        solved = board.copy()
+        board.trail = trail
+        return solved
+
+    if problem.goal_test(state):
+        yield solution()
+        return
+    stack = [(board.mark(), reversed(problem.actions(state)), board.state_key())]
+    while stack:
+        mark, actions, key = stack[-1]
+        board.undo(mark)
+        action = next(actions, None)
+        if action is None:
+            stack.pop()
+            table.add(key)
+            continue
+        problem.apply(board, action)
+        if problem.goal_test(state):
+            yield solution()
+            continue
+        key = board.state_key()
+        if not table.lookup(key):
+            stack.append((board.mark(), reversed(problem.actions(state)), key))
+
+
+def count_worker(options, tasks, results):
+    """Worker de find_solutions: enumera as soluções de cada subárvore
+    tirada de 'tasks' (tabuleiros serializados, None para sair) e põe em
+    'results' ('solution', solução) por cada solução nova e ('done', nós
+    expandidos) no fim de cada subárvore. A tabela de subárvores esgotadas
+    é partilhada por todas as subárvores do worker."""
+    backend, propagation, branching, symmetry = options
+    table = TranspositionTable(COUNT_CACHE_SIZE)
+    found = set()
+    for data in iter(tasks.get, None):
+        board = BACKENDS[backend].from_bytes(data)
+        problem = InstrumentedProblem(Bimaru(board, backend, propagation, branching=branching, symmetry=symmetry))
+        for solved in enumerate_solutions(problem, table):
+            solution = solved.solution_string()
+            if solution not in found:
+                found.add(solution)
+                results.put(('solution', solution))
+        results.put(('done', problem.succs))
+
+
+def find_solutions(board, limit=2, backend='bitboard', propagation='rescan', branching='constrained', symmetry=False,
+                   workers=1, split_depth=PARALLEL_SPLIT_DEPTH):
+    """Procura até 'limit' soluções diferentes de 'board' (None procura
+    todas); com limit=2 diz se a solução é única. Devolve um dicionário
+    com 'count' (soluções diferentes encontradas), 'complete' (se a árvore
+    foi toda percorrida), 'unique', 'solutions', 'times' (segundos desde o
+    início até cada solução), 'nodes' e 'time'.
+
+    Usa enumerate_solutions sobre Bimaru com a ramificação 'branching'; a
+    'constrained' separa cada célula em todas as suas hipóteses e por
+    isso não perde soluções. Com 'workers' > 1, expande a raiz até
+    'split_depth' níveis e distribui as subárvores (sem repetidas) por
+    processos; ao chegar a 'limit' os processos são terminados, pelo que
+    os nós das subárvores a meio não são contados. Se um worker morrer,
+    lança WorkerError em vez de esperar por ele (ver worker_result)."""
+    start = time.perf_counter()
+    problem = InstrumentedProblem(Bimaru(board, backend, propagation, branching=branching, symmetry=symmetry))
+    solutions, times = [], []
+
+    def record(solution):
+        if solution not in solutions:
+            solutions.append(solution)
+            times.append(time.perf_counter() - start)
+        return limit is not None and len(solutions) >= limit
+
+    complete = True
+    if workers <= 1:
+        for solved in enumerate_solutions(problem):
+            if record(solved.solution_string()):
+                complete = False
+                break
+        nodes = problem.succs
+    else:
+        level, reached = [problem.initial], False
+        for _ in range(split_depth):
+            children = {}
+            for state in level:
+                if problem.goal_test(state):
+                    reached = reached or record(state.board.solution_string())
+                    continue
+                for action in problem.actions(state):
+                    child = problem.result(state, action)
+                    children.setdefault(child.board.contents(), child)
+            level = list(children.values())
+        nodes = problem.succs
+        if reached:
+            complete = False
+        elif level:
+            options = (backend, propagation, branching, symmetry)
+            tasks, results = multiprocessing.Queue(), multiprocessing.Queue()
+            for state in reversed(level):
+                tasks.put(state.board.to_bytes())
+            for _ in range(workers):
+                tasks.put(None)
+            processes = [multiprocessing.Process(target=count_worker, args=(options, tasks, results), daemon=True)
+                         for _ in range(workers)]
+            for process in processes:
+                process.start()
+            pending = len(level)
+            try:
+                while pending:
+                    kind, value = worker_result(results, processes)
+                    if kind == 'done':
+                        pending -= 1
+                        nodes += value
+                    elif record(value):
+                        complete = False
+                        break
+            finally:
+                for process in processes:
+                    process.terminate()
+                    process.join()
+    return {'count': len(solutions), 'complete': complete, 'unique': complete and len(solutions) == 1,
+            'solutions': solutions, 'times': times, 'nodes': nodes, 'time': time.perf_counter() - start}
+
+
+def ship_pieces(length, is_vertical):
+    """Peças (minúsculas) de um barco, da primeira à última célula."""
+    if length == 1:
+        return 'c'
+    start, end = ('t', 'b') if is_vertical else ('l', 'r')
+    return start + 'm' * (length - 2) + end
+
+
+def ship_cells(row, col, length, is_vertical):
+    """Células de um barco, da primeira à última."""
+    return [(row + i, col) if is_vertical else (row, col + i) for i in range(length)]
+
+
+def ship_placements(board):
+    """Percorre as colocações (row, col, length, is_vertical) de barcos que
+    ainda faltam a 'board' que não tapam água nem contradizem as pistas por
+    aplicar, com a lista das células de cada uma. Só se usam as contagens,
+    as pistas e as células que já são água; as peças de barco já colocadas
+    no tabuleiro são ignoradas."""
+    hints = {(row, col): value for row, col, value in board.hints}
+    for placement in placement_catalog(board.height, board.width, board.max_ship).placements:
+        row, col, length, is_vertical = placement
+        if not board.ships[length - 1]:
+            continue
+        cells = ship_cells(row, col, length, is_vertical)
+        if any(board.get_value(r, c) in ('.', 'W') or hints.get((r, c), piece.upper()) != piece.upper()
+               for (r, c), piece in zip(cells, ship_pieces(length, is_vertical))):
+            continue
+        yield placement, cells
+
+
+def placements_board(board, placements):
+    """Devolve um tabuleiro resolvido (como o impresso pela procura) com os
+    barcos de 'placements' e as pistas de 'board'."""
+    matrix = [['.'] * board.width for _ in range(board.height)]
+    for row, col, length, is_vertical in placements:
+        for i, piece in enumerate(ship_pieces(length, is_vertical)):
+            matrix[row + i if is_vertical else row][col if is_vertical else col + i] = piece
+    for row, col, value in board.hints:
+        matrix[row][col] = value
+    return solved_board(matrix, board)
+
+
+def placements_node(problem, placements):
+    """Devolve o nó final de um caminho com uma ação SHIP_NO_PRIO por barco
+    de 'placements', com o tabuleiro resolvido como estado."""
+    node = Node(problem.initial)
+    for placement in sorted(placements):
+        action = placement + (SHIP_NO_PRIO,)
+        node = Node(None, node, action, problem.path_cost(node.path_cost, None, action, None))
+    node.state = problem.new_state(placements_board(problem.initial.board, placements))
+    return node
+
+
+def exact_cover_problem(board):
+    """Codifica 'board' como um dlx.ExactCover cujas opções são as
+    colocações de ship_placements. Os itens primários são, por esta ordem,
+    os comprimentos de barco (procura: barcos por colocar), as linhas e as
+    colunas (procura: peças por colocar; o peso é o número de células do
+    barco na linha ou coluna) e as pistas de peças de barco (procura 1).
+    Os itens secundários são os vértices da grelha: um barco ocupa os
+    vértices das suas células, pelo que dois barcos partilham um vértice
+    se e só se se tocam, mesmo na diagonal."""
+    height, width, max_ship = board.height, board.width, board.max_ship
+    ship_hints = sorted((row, col) for row, col, value in board.hints if value != 'W')
+    hint_item = {cell: max_ship + height + width + i for i, cell in enumerate(ship_hints)}
+    demands = list(board.ships) + list(board.rows) + list(board.columns) + [1] * len(ship_hints)
+    vertex_base = len(demands)
+    cover = ExactCover(demands, (height + 1) * (width + 1))
+    for placement, cells in ship_placements(board):
+        row, col, length, _ = placement
+        items = {length - 1: 1}
+        for r, c in cells:
+            items[max_ship + r] = items.get(max_ship + r, 0) + 1
+            items[max_ship + height + c] = items.get(max_ship + height + c, 0) + 1
+            if (r, c) in hint_item:
+                items[hint_item[(r, c)]] = 1
+        last_row, last_col = cells[-1]
+        for r in range(row, last_row + 2):
+            for c in range(col, last_col + 2):
+                items[vertex_base + r * (width + 1) + c] = 1
+        cover.add_option(items.items(), placement)
+    return cover
+
+
+def count_solutions(board, limit=None):
+    """Conta as soluções de 'board' com o algoritmo X (até 'limit', se
+    dado). Devolve (número de soluções, tabuleiro da primeira ou None,
+    nós expandidos)."""
+    cover = exact_cover_problem(board)
+    count = cover.search(limit)
+    solved = None if cover.first is None else placements_board(board, cover.first)
+    return count, solved, cover.nodes
+
+
+def exact_cover_search(problem):
+    """Resolve o tabuleiro inicial de 'problem' como cobertura exata com
+    dancing links, em vez de percorrer as ações de Bimaru. Os nós do
+    algoritmo X contam como expansões do InstrumentedProblem."""
+    cover = exact_cover_problem(problem.initial.board)
+    cover.search(limit=1)
+    if isinstance(problem, InstrumentedProblem):
+        problem.succs += cover.nodes
+    return None if cover.first is None else placements_node(problem, cover.first)
+
+
+def sat_problem(board):
+    """Codifica 'board' como uma sat.CNF. Devolve (cnf, colocações), em que
+    colocações associa a variável de cada colocação de ship_placements à
+    colocação.
+
+    A variável 1 + row * width + col diz se a célula é peça de barco. Cada
+    colocação verdadeira obriga as suas células a serem barco e a sua
+    vizinhança a ser água, e cada célula de barco tem de estar numa
+    colocação verdadeira; assim as colocações verdadeiras são exatamente
+    os barcos da solução. Há ainda as cláusulas das diagonais, as pistas e
+    as restrições de cardinalidade das linhas, das colunas e da frota."""
+    height, width = board.height, board.width
+    cnf = CNF()
+    cell_var = [[cnf.new_var() for _ in range(width)] for _ in range(height)]
+    neighbours = bit_tables(height, width)[2]
+    placements, covering = {}, {}
+    by_length = [[] for _ in range(board.max_ship)]
+    for placement, cells in ship_placements(board):
+        var = cnf.new_var()
+        placements[var] = placement
+        by_length[placement[2] - 1].append(var)
+        halo = 0
+        for r, c in cells:
+            cnf.add_clause([-var, cell_var[r][c]])
+            covering.setdefault((r, c), []).append(var)
+            halo |= neighbours[r * width + c]
+        for r, c in cells:
+            halo &= ~(1 << (r * width + c))
+        for index in iter_bits(halo):
+            cnf.add_clause([-var, -cell_var[index // width][index % width]])
+    for r in range(height):
+        for c in range(width):
+            cnf.add_clause([-cell_var[r][c]] + covering.get((r, c), []))
+            for dc in (-1, 1):
+                if r + 1 < height and 0 <= c + dc < width:
+                    cnf.add_clause([-cell_var[r][c], -cell_var[r + 1][c + dc]])
+    for row, col, value in board.hints:
+        cnf.add_clause([-cell_var[row][col] if value == 'W' else cell_var[row][col]])
+    for r in range(height):
+        cnf.exactly(cell_var[r], board.rows[r])
+    for c in range(width):
+        cnf.exactly([cell_var[r][c] for r in range(height)], board.columns[c])
+    for length, variables in enumerate(by_length, 1):
+        cnf.exactly(variables, board.ships[length - 1])
+    return cnf, placements
+
+
+def sat_search(problem):
+    """Resolve o tabuleiro inicial de 'problem' codificado em CNF com o
+    solver CDCL de sat.py. As decisões do solver contam como expansões do
+    InstrumentedProblem."""
+    cnf, placements = sat_problem(problem.initial.board)
+    solver = CDCLSolver(cnf)
+    satisfiable = solver.solve()
+    if isinstance(problem, InstrumentedProblem):
+        problem.succs += solver.decisions
+    if not satisfiable:
+        return None
+    model = solver.model()
+    return placements_node(problem, [placement for var, placement in placements.items() if var in model])
+
+
+SEARCHES = {
+    'dfs': depth_first_tree_search,
+    'astar': astar_search,
+    'trail': depth_first_trail_search,
+    'dlx': exact_cover_search,
+    'sat': sat_search,
+    'parallel': parallel_depth_first_search,
+}
+# Procuras que codificam a instância de raiz a partir das contagens e das pistas, sem as células já
+# preenchidas do tabuleiro, pelo que não podem partir de um tabuleiro reduzido por deduce_hints
+ENCODED_SEARCHES = ('dlx', 'sat')
+
+
+def default_search(board):
+    """Escolhe a procura a usar quando nenhuma é pedida, a partir do
+    tabuleiro acabado de ler."""
+    return 'astar' if len(board.hints) == 3 else 'dfs'
+
+
+def astar_flag(board):
+    """Diz se alguma das cinco primeiras linhas tem 4 ou mais peças. Não
+    entra em default_search; o portefólio (portfolio.py) regista-o com a
+    configuração vencedora para se poder afinar essa escolha."""
+    return any(num >= 4 for num in board.rows[:5])
+
+
+HOT_PATHS = ('place_ship', 'can_place_ship', 'check_adjacencies', 'fill_board_water', 'place_guaranteed_ships',
+             'actions', 'result', 'apply')
+
+
+class HotPathStats:
+    """Chamadas e tempo acumulado de cada método de HOT_PATHS durante um
+    bloco instrument_hot_paths. O tempo de um método inclui o das chamadas
+    que faz, pelo que place_ship inclui fill_board_water e este pode
+    incluir outros place_ship."""
+
+    def __init__(self):
+        self.counters = {name: [0, 0.0] for name in HOT_PATHS}
+
+    def as_dict(self):
+        return {name: {'calls': calls, 'time': seconds} for name, (calls, seconds) in self.counters.items()}
+
+    def summary(self):
+        lines = ['{:<24}{:>12}{:>12}{:>14}'.format('método', 'chamadas', 'tempo (ms)', 'média (µs)')]
+        for name, (calls, seconds) in self.counters.items():
+            if calls:
+                lines.append('{:<24}{:>12}{:>12.1f}{:>14.2f}'.format(name, calls, seconds * 1000,
+                                                                      seconds / calls * 1e6))
+        return '\n'.join(lines)
+
+
+# Estado partilhado dos blocos instrument_hot_paths abertos, protegido por _hot_paths_lock: as
+# estatísticas de cada bloco e os métodos originais, substituídos só pelo primeiro bloco a abrir
+_hot_paths_lock = threading.Lock()
+_active_hot_paths = ()
+_patched_hot_paths = []
+
+
+def timed_method(method, name):
+    """Envolve 'method' para contar as chamadas e o tempo em 'name' de
+    todos os HotPathStats dos blocos instrument_hot_paths abertos."""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            for stats in _active_hot_paths:
+                counter = stats.counters[name]
+                counter[0] += 1
+                counter[1] += elapsed
+    return wrapper
+
+
+@contextmanager
+def instrument_hot_paths(stats=None):
+    """Dentro do bloco, os métodos de HOT_PATHS de todas as representações
+    de BACKENDS e de Bimaru contam as chamadas e o tempo em 'stats' (um
+    HotPathStats novo por omissão, que é o valor do with). Os métodos são
+    substituídos nas classes e repostos à saída, pelo que fora do bloco
+    não há custo nenhum; dentro dele, todas as threads são medidas.
+
+    Os blocos podem sobrepor-se (por exemplo, em threads com solvers
+    diferentes): só o primeiro a abrir substitui os métodos e só o último
+    a fechar os repõe, e enquanto estão abertos cada chamada conta em
+    todos eles."""
+    global _active_hot_paths
+    stats = stats or HotPathStats()
+    with _hot_paths_lock:
+        if not _active_hot_paths:
+            for cls in list(BACKENDS.values()) + [Bimaru]:
+                for name in HOT_PATHS:
+                    method = vars(cls).get(name)
+                    if method is not None:
+                        _patched_hot_paths.append((cls, name, method))
+                        setattr(cls, name, timed_method(method, name))
+        _active_hot_paths += (stats,)
+    try:
+        yield stats
+    finally:
+        with _hot_paths_lock:
+            _active_hot_paths = tuple(active for active in _active_hot_paths if active is not stats)
+            if not _active_hot_paths:
+                for cls, name, method in _patched_hot_paths:
+                    setattr(cls, name, method)
+                _patched_hot_paths.clear()
+
+
+class BudgetExceeded(Exception):
+    """Lançada por BudgetedProblem quando a procura esgota o orçamento;
+    'status' é 'node-limit' ou 'timeout'."""
+
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+class BudgetedProblem(InstrumentedProblem):
+    """InstrumentedProblem que interrompe a procura com BudgetExceeded ao
+    expandir mais de 'max_nodes' nós ou depois do instante 'deadline' (de
+    time.perf_counter). Entretanto guarda uma cópia do tabuleiro mais
+    fundo a que chegou, o que tem mais barcos colocados.
+
+    O orçamento é verificado em actions(), pelo que só vale para as
+    procuras que expandem nós de Bimaru (dfs, astar e trail); dlx e sat
+    não o veem e parallel só o vê na expansão da raiz."""
+
+    def __init__(self, problem, max_nodes=None, deadline=None):
+        super().__init__(problem)
+        self.max_nodes = max_nodes
+        self.deadline = deadline
+        self.total_ships = sum(problem.initial.board.ships)
+        self.ships_placed = -1  # Barcos colocados em 'deepest'
+        self.deepest = None
+
+    def actions(self, state):
+        if self.max_nodes is not None and self.succs >= self.max_nodes:
+            raise BudgetExceeded('node-limit')
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise BudgetExceeded('timeout')
+        board = state.board
+        placed = self.total_ships - sum(board.ships)
+        if placed > self.ships_placed:
+            # Na procura trail o tabuleiro é partilhado: copia-se sem o registo de alterações
+            trail, board.trail = board.trail, None
+            self.deepest = board.copy()
+            board.trail = trail
+            self.ships_placed = placed
+        return super().actions(state)
+
+
+class BimaruSolver:
+    """Resolve instâncias de Bimaru guardando no próprio objeto todos os
+    dados de cada resolução, sem estado global, pelo que vários solvers
+    podem correr ao mesmo tempo em threads diferentes."""
+
+    def __init__(self, backend='list', search=None, propagation='rescan', heuristic='legacy', branching='scan',
+                 transpositions=0, symmetry=False, search_options=None, cache=None, max_nodes=None,
+                 time_limit=None, deduce=False):
+        self.backend = backend
+        self.search = search  # None escolhe com default_search
+        self.search_options = search_options or {}  # Argumentos extra da função de procura
+        self.propagation = propagation
+        self.heuristic = heuristic
+        self.branching = branching
+        self.transpositions = transpositions
+        self.symmetry = symmetry
+        self.cache = cache  # SolutionCache consultada antes de cada procura, ou None
+        self.max_nodes = max_nodes  # Orçamento de nós expandidos por instância (ver BudgetedProblem)
+        self.time_limit = time_limit  # Segundos por instância
+        self.deduce = deduce  # Aplica deduce_hints antes de procurar (exceto com ENCODED_SEARCHES)
+        self.deduction = None  # Relatório de deduce_hints da última instância
+        self.board = None  # Tabuleiro inicial da última instância
+        self.hint_num = 0
+        self.astar_flag = False
+        self.search_used = None
+        self.problem = None  # InstrumentedProblem, com as contagens de nós
+        self.node = None
+        self.status = None  # 'solved', 'unsolvable', 'node-limit' ou 'timeout'
+
+    def solve(self, instance):
+        """Resolve 'instance' (string, ficheiro aberto ou Board já lido) e
+        devolve o tabuleiro da solução, ou None se não houver solução ou
+        se a procura esgotar o orçamento (max_nodes, time_limit); 'status'
+        distingue os casos e report() resume o que a procura fez.
+
+        Com uma cache, uma instância já resolvida (ou uma sua simetria) não
+        é procurada: search_used fica 'cache' e problem e node None. Só
+        se guardam na cache as instâncias sem solução quando a procura
+        correu sem orçamento nem deduce_hints."""
+        start = time.perf_counter()
+        board = instance if isinstance(instance, Board) else Board.parse_instance(instance)
+        self.board = board
+        self.hint_num = len(board.hints)
+        self.astar_flag = astar_flag(board)
+        self.node = None
+        if self.cache is not None:
+            found, solution = self.cache.get(board)
+            if found:
+                self.search_used, self.problem = 'cache', None
+                self.status = 'unsolvable' if solution is None else 'solved'
+                return solution
+        self.search_used = self.search or default_search(board)
+        self.deduction = None
+        if self.deduce and self.search_used not in ENCODED_SEARCHES:
+            # Numa cópia: self.board fica com as contagens e pistas da instância
+            board = board.copy()
+            self.deduction = deduce_hints(board)
+        problem = Bimaru(board, self.backend, self.propagation, self.heuristic, self.branching,
+                         self.transpositions, self.symmetry)
+        if self.max_nodes is None and self.time_limit is None:
+            self.problem = InstrumentedProblem(problem)
+        else:
+            deadline = None if self.time_limit is None else start + self.time_limit
+            self.problem = BudgetedProblem(problem, self.max_nodes, deadline)
+        try:
+            self.node = SEARCHES[self.search_used](self.problem, **self.search_options)
+        except BudgetExceeded as exceeded:
+            self.status = exceeded.status
+            return None
+        solution = None if self.node is None else self.node.state.board
+        self.status = 'unsolvable' if solution is None else 'solved'
+        # Uma solução vale sempre; "sem solução" só se a procura foi completa, sem orçamento nem dedução
+        exhaustive = self.max_nodes is None and self.time_limit is None and self.deduction is None
+        if self.cache is not None and (solution is not None or exhaustive):
+            self.cache.put(self.board, solution)
+        return solution
+
+    def report(self):
+        """Resumo da última resolução: 'status', 'search', 'nodes'
+        (expandidos) e, se a procura esgotou o orçamento, 'ships_placed' e
+        'ships_total' do tabuleiro mais fundo a que chegou e as linhas
+        desse tabuleiro em 'deepest' ('-' nas células por preencher). Com
+        'deduce' e uma procura fora de ENCODED_SEARCHES, 'deduction' é o
+        relatório de deduce_hints."""
+        problem = self.problem
+        report = {'status': self.status, 'search': self.search_used, 'nodes': problem.succs if problem else 0}
+        if self.deduction is not None:
+            report['deduction'] = self.deduction
+        if self.status in ('node-limit', 'timeout') and problem.deepest is not None:
+            report.update(ships_placed=problem.ships_placed, ships_total=problem.total_ships,
+                          deepest=problem.deepest.solution_lines())
+        return report
+
+
+def solve(instance, backend='list', search=None, propagation='rescan', heuristic='legacy', branching='scan',
+          transpositions=0, symmetry=False, search_options=None, cache=None, max_nodes=None, time_limit=None,
+          deduce=False):
+    """Resolve uma instância com um BimaruSolver novo (ver BimaruSolver.solve)."""
+    return BimaruSolver(backend, search, propagation, heuristic, branching, transpositions,
+                        symmetry, search_options, cache, max_nodes, time_limit, deduce).solve(instance)
 
 
 if __name__ == "__main__":
-    board1 = Board.parse_instance()
-    bimaru = Bimaru(board1)
-    if hint_num == 3:
-        sol = astar_search(bimaru)
-    else:
-        sol = depth_first_tree_search(bimaru)
+    parser = argparse.ArgumentParser(description="Resolve uma instância de Bimaru lida do stdin.")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="list",
+                        help="representação do tabuleiro usada na procura")
+    parser.add_argument("--search", choices=sorted(SEARCHES), default=None,
+                        help="algoritmo de procura (por omissão A* com 3 pistas, senão DFS)")
+    parser.add_argument("--propagation", choices=PROPAGATIONS, default="rescan",
+                        help="propagação depois de cada ação: varrimento completo ou fila de linhas alteradas")
+    parser.add_argument("--heuristic", choices=sorted(HEURISTICS), default="legacy",
+                        help="heurística da procura A*")
+    parser.add_argument("--branching", choices=BRANCHINGS, default="scan",
+                        help="escolha das ações: varrimento a partir de lastpos ou restrição mais apertada")
+    parser.add_argument("--transpositions", type=int, default=0, metavar="N",
+                        help="tabela de transposições com N entradas para não expandir estados repetidos")
+    parser.add_argument("--symmetry", action="store_true",
+                        help="gera os barcos só pela ordem canónica das células de origem")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processos da procura parallel (por omissão, um por núcleo)")
+    parser.add_argument("--split-depth", type=int, default=PARALLEL_SPLIT_DEPTH,
+                        help="níveis da raiz expandidos pela procura parallel antes de distribuir o trabalho")
+    parser.add_argument("--all", nargs="?", const="-", metavar="FICHEIRO",
+                        help="resolve todas as instâncias concatenadas do stdin (ou de FICHEIRO, lido com mmap)")
+    parser.add_argument("--binary", action="store_true",
+                        help="com --all, escreve as soluções no formato binário compacto (ver encode_solution)")
+    parser.add_argument("--stats", action="store_true",
+                        help="escreve no stderr os nós expandidos e as chamadas e tempos dos métodos mais usados")
+    parser.add_argument("--stats-json", metavar="FICHEIRO",
+                        help="escreve as mesmas estatísticas em JSON (- para o stderr)")
+    parser.add_argument("--deduce", action="store_true",
+                        help="aplica as pistas forçadas e a água à volta das pistas antes de procurar "
+                             "(ignorado pelas procuras dlx e sat)")
+    parser.add_argument("--max-nodes", type=int, default=None, metavar="N",
+                        help="desiste ao fim de N nós expandidos (procuras dfs, astar e trail)")
+    parser.add_argument("--time-limit", type=float, default=None, metavar="SEGUNDOS",
+                        help="desiste ao fim deste tempo por instância (procuras dfs, astar e trail)")
+    parser.add_argument("--cache", metavar="FICHEIRO",
+                        help="cache SQLite de soluções, consultada antes de procurar (ver SolutionCache)")
+    parser.add_argument("--cache-size", type=int, default=SOLUTION_CACHE_SIZE, metavar="N",
+                        help="número máximo de soluções na cache; as usadas há mais tempo saem primeiro")
+    parser.add_argument("--count", type=int, nargs="?", const=2, metavar="N",
+                        help="em vez de resolver, procura até N soluções (por omissão 2, ou seja, diz se a solução "
+                             "é única; 0 conta todas) e escreve um relatório em JSON; usa --workers e --split-depth")
+    parser.add_argument("--dimacs", metavar="FICHEIRO",
+                        help="escreve a codificação CNF da instância em DIMACS (- para o stdout) em vez de a resolver")
+    args = parser.parse_args()
+    if args.dimacs:
+        instance = Board.parse_instance(sys.stdin)
+        cnf, _ = sat_problem(instance)
+        comments = ['bimaru {}x{}'.format(instance.height, instance.width),
+                    'variável 1 + row * {} + col: a célula (row, col) é peça de barco'.format(instance.width)]
+        if args.dimacs == '-':
+            sys.stdout.write(cnf.dimacs(comments))
+        else:
+            with open(args.dimacs, 'w') as output:
+                output.write(cnf.dimacs(comments))
+        sys.exit()
+    if args.count is not None:
+        report = find_solutions(Board.parse_instance(sys.stdin), args.count or None, args.backend, args.propagation,
+                                args.branching, args.symmetry, args.workers or 1, args.split_depth)
+        print(json.dumps(report, indent=1))
+        sys.exit()
+    search_options = None
+    if args.search == 'parallel':
+        search_options = {'workers': args.workers, 'split_depth': args.split_depth}
+    cache = SolutionCache(args.cache, args.cache_size) if args.cache else None
+    if args.all:
+        source = sys.stdin.buffer if args.all == '-' else args.all
+        solver = BimaruSolver(args.backend, args.search, args.propagation, args.heuristic, args.branching,
+                              args.transpositions, args.symmetry, search_options, cache, args.max_nodes,
+                              args.time_limit, args.deduce)
+        with SolutionWriter(sys.stdout.buffer, args.binary) as writer:
+            for index, instance in enumerate(parse_instances(source, use_mmap=True,
+                                                             on_error=lambda error: print(error, file=sys.stderr))):
+                solution = solver.solve(instance)
+                if solver.status in ('node-limit', 'timeout'):
+                    # Sai como sem solução; o progresso parcial vai para o stderr
+                    print('instância {}: {}'.format(index, json.dumps(solver.report())), file=sys.stderr)
+                writer.write(solution)
+        sys.exit()
+    solver = BimaruSolver(args.backend, args.search, args.propagation, args.heuristic, args.branching,
+                          args.transpositions, args.symmetry, search_options, cache, args.max_nodes,
+                          args.time_limit, args.deduce)
+    instrumented = args.stats or args.stats_json
+    start = time.perf_counter()
+    with instrument_hot_paths() if instrumented else nullcontext() as hot_paths:
+        sol = solver.solve(sys.stdin)
+    elapsed = time.perf_counter() - start
+    if instrumented and solver.problem is None:
+        print('solução lida da cache em {:.3f} s'.format(elapsed), file=sys.stderr)
+    elif instrumented:
+        problem = solver.problem
+        report = {'search': solver.search_used, 'backend': args.backend, 'time': elapsed,
+                  'nodes': {'expanded': problem.succs, 'generated': problem.states, 'goal_tests': problem.goal_tests},
+                  'hot_paths': hot_paths.as_dict()}
+        if solver.deduction is not None:
+            report['deduction'] = solver.deduction
+        if args.stats:
+            print('{}: {:.3f} s, {} nós expandidos, {} gerados, {} testes objetivo'.format(
+                solver.search_used, elapsed, problem.succs, problem.states, problem.goal_tests), file=sys.stderr)
+            if solver.deduction is not None:
+                print('dedução: {applied} de {hints} pistas aplicadas antes da procura (profundidade -{applied}), '
+                      '{water} células de água, {ships} barcos'.format(**solver.deduction), file=sys.stderr)
+            print(hot_paths.summary(), file=sys.stderr)
+        if args.stats_json == '-':
+            print(json.dumps(report), file=sys.stderr)
+        elif args.stats_json:
+            with open(args.stats_json, 'w') as output:
+                json.dump(report, output, indent=1)
+    if solver.status in ('node-limit', 'timeout'):
+        print(json.dumps(solver.report()), file=sys.stderr)
+        sys.exit(2)
     if sol is None:
-        print("There is no solution available. Better luck next time :)")
+        print(NO_SOLUTION)
     else:
-        sol.state.board.print_solution()
+        sol.print_solution()
     pass
@@ -0,0 +1,175 @@
+"""Algoritmo X de Knuth com dancing links, com procuras e pesos.
+
+Um problema de cobertura exata generalizado tem itens e opções. Cada item
+primário tem uma procura (quantas unidades tem de receber) e cada opção dá
+a cada um dos seus itens um peso. Uma solução é um conjunto de opções cujos
+pesos somam exatamente a procura de cada item primário e no máximo 1 em
+cada item secundário. Com procuras e pesos iguais a 1 é a cobertura exata
+clássica.
+
+As colunas são listas duplamente ligadas circulares guardadas em listas de
+inteiros (up, down, top), como em Knuth. Esconder uma opção tira os seus
+nós de todas as colunas; as opções escondidas ficam numa pilha e são
+repostas pela ordem inversa ao recuar.
+
+Para não contar a mesma solução várias vezes quando um item precisa de mais
+do que uma opção, a procura ramifica sobre as opções do item por ordem: o
+k-ésimo ramo usa a opção k e exclui as opções 1..k-1.
+"""
+
+
+class ExactCover:
+    """Problema de cobertura exata com procuras e pesos.
+
+    'demands' tem a procura de cada item primário (0, 1, ...); os itens
+    secundários numeram-se a seguir a estes, de len(demands) até
+    len(demands) + num_secondary - 1."""
+
+    def __init__(self, demands, num_secondary=0):
+        self.primary = len(demands)
+        size = self.primary + num_secondary
+        self.demand = list(demands) + [1] * num_secondary
+        # Nós 0..size-1 são os cabeçalhos das colunas
+        self.up = list(range(size))
+        self.down = list(range(size))
+        self.top = list(range(size))
+        self.weight = [0] * size
+        self.option_of = [None] * size
+        self.length = [0] * size  # Opções vivas em cada coluna
+        self.supply = [0] * size  # Soma dos pesos das opções vivas em cada coluna
+        self.starts = []  # Primeiro nó de cada opção
+        self.ends = []
+        self.payloads = []
+        self.alive = []
+        self.hidden = []  # Pilha das opções escondidas
+        self.taken = []  # Pilha das opções escolhidas
+        self.nodes = 0
+        self.solutions = 0
+        self.first = None
+
+    def add_option(self, items, payload=None):
+        """Acrescenta uma opção com os pares (item, peso) de 'items'.
+        Opções com algum peso maior do que a procura do item nunca podem
+        ser escolhidas e são ignoradas; devolve o identificador da opção ou
+        None."""
+        items = [(item, weight) for item, weight in items if weight]
+        if any(weight > self.demand[item] for item, weight in items):
+            return None
+        option = len(self.starts)
+        self.starts.append(len(self.top))
+        for item, weight in items:
+            node = len(self.top)
+            last = self.up[item]
+            self.up.append(last)
+            self.down.append(item)
+            self.top.append(item)
+            self.weight.append(weight)
+            self.option_of.append(option)
+            self.down[last] = node
+            self.up[item] = node
+            self.length[item] += 1
+            self.supply[item] += weight
+        self.ends.append(len(self.top))
+        self.payloads.append(payload)
+        self.alive.append(True)
+        return option
+
+    def hide(self, option):
+        """Tira 'option' de todas as colunas, se ainda lá estiver."""
+        if not self.alive[option]:
+            return
+        up, down, top, weight = self.up, self.down, self.top, self.weight
+        for node in range(self.starts[option], self.ends[option]):
+            down[up[node]] = down[node]
+            up[down[node]] = up[node]
+            self.length[top[node]] -= 1
+            self.supply[top[node]] -= weight[node]
+        self.alive[option] = False
+        self.hidden.append(option)
+
+    def select(self, option):
+        """Escolhe 'option': esconde-a, desconta os seus pesos às procuras e
+        esconde as opções que deixaram de caber."""
+        self.hide(option)
+        self.taken.append(option)
+        down, weight, option_of = self.down, self.weight, self.option_of
+        for node in range(self.starts[option], self.ends[option]):
+            item = self.top[node]
+            self.demand[item] -= weight[node]
+            left = self.demand[item]
+            other = down[item]
+            while other != item:
+                if weight[other] > left:
+                    self.hide(option_of[other])
+                other = down[other]
+
+    def mark(self):
+        return len(self.hidden), len(self.taken)
+
+    def undo(self, mark):
+        """Desfaz as escolhas e as opções escondidas depois de 'mark'."""
+        hidden_mark, taken_mark = mark
+        while len(self.taken) > taken_mark:
+            option = self.taken.pop()
+            for node in range(self.starts[option], self.ends[option]):
+                self.demand[self.top[node]] += self.weight[node]
+        up, down, top, weight = self.up, self.down, self.top, self.weight
+        while len(self.hidden) > hidden_mark:
+            option = self.hidden.pop()
+            for node in reversed(range(self.starts[option], self.ends[option])):
+                down[up[node]] = node
+                up[down[node]] = node
+                self.length[top[node]] += 1
+                self.supply[top[node]] += weight[node]
+            self.alive[option] = True
+
+    def choose(self):
+        """Devolve o item primário por satisfazer com menos opções vivas,
+        None se já não há procura por satisfazer, ou False se algum item
+        já não pode ser satisfeito com as opções que restam."""
+        best, best_length = None, None
+        for item in range(self.primary):
+            demand = self.demand[item]
+            if not demand:
+                continue
+            if self.supply[item] < demand:
+                return False
+            if best is None or self.length[item] < best_length:
+                best, best_length = item, self.length[item]
+        return best
+
+    def search(self, limit=None):
+        """Conta as soluções, parando ao chegar a 'limit' (None conta
+        todas). Guarda em 'first' os payloads das opções da primeira
+        solução encontrada e devolve o número de soluções."""
+        self.nodes = 0
+        self.solutions = 0
+        self.first = None
+        self._search(limit)
+        return self.solutions
+
+    def _search(self, limit):
+        item = self.choose()
+        if item is None:
+            self.solutions += 1
+            if self.first is None:
+                self.first = [self.payloads[option] for option in self.taken]
+            return limit is not None and self.solutions >= limit
+        if item is False:
+            return False
+        mark = self.mark()
+        stop = False
+        node = self.down[item]
+        while node != item and self.supply[item] >= self.demand[item]:
+            option = self.option_of[node]
+            self.nodes += 1
+            branch = self.mark()
+            self.select(option)
+            stop = self._search(limit)
+            self.undo(branch)
+            if stop:
+                break
+            self.hide(option)  # Nos ramos seguintes, esta opção fica de fora
+            node = self.down[node]
+        self.undo(mark)
+        return stop
@@ -0,0 +1,181 @@
+"""Gerador de instâncias de Bimaru.
+
+Coloca aleatoriamente uma frota num tabuleiro height x width, sem barcos a
+tocar-se (nem na diagonal), e escreve a instância no formato lido por
+Board.parse_instance. Opcionalmente acrescenta pistas até a solução ser
+única e escreve um corpus de instâncias com as soluções em .out.
+
+Uso:
+    $ python3 generator.py corpus/ --count 50 --hints 5 --unique --seed 0
+"""
+
+import argparse
+import os
+import random
+
+from bimaru import DEFAULT_FLEET, Board, count_solutions, ship_cells, ship_pieces
+
+
+def scaled_fleet(size, density=0.2):
+    """Frota clássica (k barcos de comprimento 1, k - 1 de comprimento 2,
+    ..., 1 de comprimento k) com o maior k cujas peças não ocupam mais do
+    que 'density' de um tabuleiro size x size. Para size = 10 é a frota
+    DEFAULT_FLEET."""
+    k = 1
+    while (k + 1) * (k + 2) * (k + 3) // 6 <= density * size * size:
+        k += 1
+    return list(range(k, 0, -1))
+
+
+def random_layout(height, width, fleet=DEFAULT_FLEET, rnd=random, attempts=200):
+    """Devolve uma grelha (lista de strings) com a frota 'fleet' colocada ao
+    acaso, com peças em minúsculas ('t', 'b', 'm', 'l', 'r', 'c') e água
+    ('.'). Recomeça do zero quando um barco não cabe em 'attempts'
+    tentativas."""
+    lengths = [length for length in range(len(fleet), 0, -1) for _ in range(fleet[length - 1])]
+    while True:
+        grid = [['.'] * width for _ in range(height)]
+        if all(_place_random_ship(grid, length, rnd, attempts) for length in lengths):
+            return [''.join(line) for line in grid]
+
+
+def _place_random_ship(grid, length, rnd, attempts):
+    height, width = len(grid), len(grid[0])
+    for _ in range(attempts):
+        is_vertical = length > 1 and rnd.random() < 0.5
+        if is_vertical and length > height or not is_vertical and length > width:
+            continue
+        row = rnd.randrange(height - (length - 1 if is_vertical else 0))
+        col = rnd.randrange(width - (0 if is_vertical else length - 1))
+        cells = ship_cells(row, col, length, is_vertical)
+        if any(grid[r][c] != '.' for cell_r, cell_c in cells
+               for r in range(max(cell_r - 1, 0), min(cell_r + 2, height))
+               for c in range(max(cell_c - 1, 0), min(cell_c + 2, width))):
+            continue
+        for (r, c), piece in zip(cells, ship_pieces(length, is_vertical)):
+            grid[r][c] = piece
+        return True
+    return False
+
+
+def layout_counts(grid):
+    """Devolve (rows, columns), o número de peças de cada linha e coluna."""
+    rows = [sum(cell != '.' for cell in line) for line in grid]
+    columns = [sum(line[c] != '.' for line in grid) for c in range(len(grid[0]))]
+    return rows, columns
+
+
+def sample_hints(grid, num_hints, rnd=random):
+    """Escolhe 'num_hints' células ao acaso e devolve-as como pistas
+    (row, col, value), com 'W' para a água."""
+    cells = [(r, c) for r in range(len(grid)) for c in range(len(grid[0]))]
+    hints = []
+    for r, c in sorted(rnd.sample(cells, num_hints)):
+        hints.append((r, c, 'W' if grid[r][c] == '.' else grid[r][c].upper()))
+    return hints
+
+
+def instance_text(grid, hints, fleet=DEFAULT_FLEET):
+    """Escreve a instância no formato de entrada. A linha FLEET só aparece
+    quando a frota não é a clássica."""
+    rows, columns = layout_counts(grid)
+    lines = ['ROW\t' + '\t'.join(map(str, rows)), 'COLUMN\t' + '\t'.join(map(str, columns))]
+    if tuple(fleet) != DEFAULT_FLEET:
+        lines.append('FLEET\t' + '\t'.join(map(str, fleet)))
+    lines.append(str(len(hints)))
+    lines.extend('HINT\t{}\t{}\t{}'.format(*hint) for hint in hints)
+    return '\n'.join(lines) + '\n'
+
+
+def random_instance(height, width, fleet=DEFAULT_FLEET, num_hints=5, seed=None):
+    """Gera uma instância aleatória. Devolve (texto, grelha da solução)."""
+    rnd = random.Random(seed)
+    grid = random_layout(height, width, fleet, rnd)
+    return instance_text(grid, sample_hints(grid, num_hints, rnd), fleet), grid
+
+
+def solution_text(grid, hints):
+    """Solução tal como impressa por Board.print_solution: a grelha com as
+    células das pistas em maiúsculas ('W' na água)."""
+    lines = [list(line) for line in grid]
+    for row, col, value in hints:
+        lines[row][col] = value
+    return '\n'.join(''.join(line) for line in lines)
+
+
+def unique_instance(height, width, fleet=DEFAULT_FLEET, num_hints=5, seed=None, max_hints=None):
+    """Gera uma instância aleatória com solução única. Começa com
+    'num_hints' pistas e, enquanto bimaru.count_solutions encontrar mais do
+    que uma solução, acrescenta uma pista numa célula em que a solução
+    encontrada difere da grelha gerada (ou, se for a própria grelha, numa
+    célula ao acaso). Devolve (texto, solução como em solution_text), ou
+    None se forem precisas mais do que 'max_hints' pistas. Lança
+    ValueError se count_solutions não encontrar solução nenhuma."""
+    rnd = random.Random(seed)
+    grid = random_layout(height, width, fleet, rnd)
+    cells = [(r, c) for r in range(height) for c in range(width)]
+    chosen = rnd.sample(cells, num_hints)
+    while True:
+        hints = [(r, c, 'W' if grid[r][c] == '.' else grid[r][c].upper()) for r, c in sorted(chosen)]
+        text = instance_text(grid, hints, fleet)
+        count, solved, _ = count_solutions(Board.parse_instance(text), limit=2)
+        if count == 1:
+            return text, solution_text(grid, hints)
+        if count == 0:
+            # As pistas vêm da grelha gerada, que é uma solução: não pode acontecer com um contador correto
+            raise ValueError("count_solutions não encontrou nenhuma solução para a instância gerada "
+                             "(seed={}):\n{}".format(seed, text))
+        if max_hints is not None and len(chosen) >= max_hints:
+            return None
+        free = [cell for cell in cells if cell not in chosen]
+        found = solved.solution_string().lower().replace('w', '.').split('\n')
+        differ = [(r, c) for r, c in free if found[r][c] != grid[r][c]]
+        chosen.append(rnd.choice(differ or free))
+
+
+def write_corpus(directory, count, height=10, width=10, fleet=DEFAULT_FLEET, num_hints=5, seed=0, unique=False,
+                 max_hints=None):
+    """Escreve em 'directory' as instâncias instNNN.txt geradas com as
+    sementes seed, seed + 1, ... Com 'unique', só guarda instâncias com
+    solução única (ver unique_instance) e escreve a solução em instNNN.out,
+    que batch.py compara com a que encontrar. Devolve os caminhos
+    escritos."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    current = seed
+    while len(paths) < count:
+        if unique:
+            generated = unique_instance(height, width, fleet, num_hints, current, max_hints)
+        else:
+            generated = random_instance(height, width, fleet, num_hints, current)[0], None
+        current += 1
+        if generated is None:
+            continue
+        text, solution = generated
+        path = os.path.join(directory, 'inst{:03d}.txt'.format(len(paths)))
+        with open(path, 'w') as instance:
+            instance.write(text)
+        if solution is not None:
+            with open(os.path.splitext(path)[0] + '.out', 'w') as out:
+                out.write(solution + '\n')
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera um corpus de instâncias de Bimaru.")
+    parser.add_argument("directory", help="pasta onde escrever as instâncias")
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--height", type=int, default=10)
+    parser.add_argument("--width", type=int, default=10)
+    parser.add_argument("--fleet", type=int, nargs="+", default=list(DEFAULT_FLEET),
+                        help="número de barcos de comprimento 1, 2, 3, ...")
+    parser.add_argument("--hints", type=int, default=5, help="pistas por instância (o mínimo, com --unique)")
+    parser.add_argument("--unique", action="store_true",
+                        help="acrescenta pistas até a solução ser única e escreve a solução em .out")
+    parser.add_argument("--max-hints", type=int, default=None, help="com --unique, descarta as que precisem de mais")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for path in write_corpus(args.directory, args.count, args.height, args.width, args.fleet, args.hints, args.seed,
+                             args.unique, args.max_hints):
+        print(path)
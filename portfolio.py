@@ -0,0 +1,114 @@
+"""Portefólio de configurações do solver de Bimaru.
+
+Resolve a mesma instância com várias configurações ao mesmo tempo, cada uma
+no seu processo. A primeira a encontrar uma solução ganha e as outras são
+terminadas. A configuração vencedora é registada (logging, nível INFO)
+juntamente com o número de pistas e o astar_flag da instância, para se
+poder afinar a escolha de bimaru.default_search.
+
+Uma configuração que diga que não há solução não termina o portefólio,
+porque nem todas as procuras são completas: só quando todas acabam sem
+solução é que a instância é dada como impossível.
+
+Uso:
+    $ python3 portfolio.py < instance01.txt
+    $ python3 portfolio.py --configs astar dfs dlx --timeout 60 < instance01.txt
+"""
+
+import argparse
+import logging
+import multiprocessing
+import queue
+import sys
+import time
+
+import bimaru
+
+logger = logging.getLogger(__name__)
+
+# Nome -> argumentos de bimaru.BimaruSolver
+PORTFOLIO = {
+    'astar': {'search': 'astar'},
+    'astar-fleet': {'search': 'astar', 'backend': 'bitboard', 'heuristic': 'fleet-segments'},
+    'dfs': {'search': 'trail', 'backend': 'bitboard'},
+    'dfs-constrained': {'search': 'trail', 'backend': 'bitboard', 'branching': 'constrained'},
+    'dlx': {'search': 'dlx'},
+    'sat': {'search': 'sat'},
+}
+
+
+def run_config(name, options, board, results):
+    """Resolve 'board' com a configuração 'name' e põe em 'results' o
+    tuplo (nome, solução ou None, nós expandidos, tempo, erro). Corre num
+    processo do portefólio."""
+    start = time.perf_counter()
+    solver = bimaru.BimaruSolver(**options)
+    solution, error = None, None
+    try:
+        solution = solver.solve(board)
+    except Exception as exc:
+        error = '{}: {}'.format(type(exc).__name__, exc)
+    nodes = solver.problem.succs if solver.problem is not None else 0
+    results.put((name, solution, nodes, time.perf_counter() - start, error))
+
+
+def solve_portfolio(instance, configs=None, timeout=None):
+    """Resolve 'instance' (string, ficheiro aberto ou Board já lido) com as
+    configurações 'configs' de PORTFOLIO (por omissão, todas), cada uma
+    num processo. Devolve (nome da vencedora, tabuleiro da solução, tempo)
+    ou (None, None, tempo) se nenhuma encontrou solução dentro de
+    'timeout' segundos."""
+    board = instance if isinstance(instance, bimaru.Board) else bimaru.Board.parse_instance(instance)
+    configs = list(configs or PORTFOLIO)
+    start = time.perf_counter()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=run_config, args=(name, PORTFOLIO[name], board, results), daemon=True)
+                 for name in configs]
+    for process in processes:
+        process.start()
+    winner, solution = None, None
+    try:
+        for _ in configs:
+            remaining = None if timeout is None else timeout - (time.perf_counter() - start)
+            if remaining is not None and remaining <= 0:
+                break
+            try:
+                name, board_solved, nodes, elapsed, error = results.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if error is not None:
+                logger.warning("%s falhou: %s", name, error)
+            elif board_solved is None:
+                logger.debug("%s terminou sem solução em %.3f s (%d nós)", name, elapsed, nodes)
+            else:
+                winner, solution = name, board_solved
+                logger.info("%s venceu em %.3f s (%d nós; %d pistas, astar_flag=%s, default_search=%s)",
+                            name, elapsed, nodes, len(board.hints), bimaru.astar_flag(board),
+                            bimaru.default_search(board))
+                break
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
+        results.close()
+    if winner is None:
+        logger.info("nenhuma configuração encontrou solução (%s)", ', '.join(configs))
+    return winner, solution, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resolve uma instância de Bimaru lida do stdin com um portefólio "
+                                                 "de configurações em paralelo.")
+    parser.add_argument("--configs", nargs="+", choices=sorted(PORTFOLIO), default=None,
+                        help="configurações a correr (por omissão, todas)")
+    parser.add_argument("--timeout", type=float, default=None, help="tempo limite, em segundos")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stderr)
+
+    _, sol, _ = solve_portfolio(sys.stdin, args.configs, args.timeout)
+    if sol is None:
+        print("There is no solution available. Better luck next time :)")
+    else:
+        sol.print_solution()
@@ -0,0 +1,288 @@
+"""Fórmulas CNF e um solver CDCL em Python puro.
+
+Os literais são inteiros não nulos como em DIMACS: v é a variável v
+verdadeira e -v a variável falsa. CNF guarda as cláusulas e sabe
+escrevê-las em DIMACS; CDCLSolver resolve-as com dois literais vigiados
+por cláusula, aprendizagem de cláusulas pelo primeiro ponto de
+implicação único (1UIP), retrocesso não cronológico, escolha de variáveis
+por atividade (VSIDS), memória de fase e recomeços pela sequência de Luby.
+"""
+
+import heapq
+
+
+class CNF:
+    """Conjunto de cláusulas sobre as variáveis 1..num_vars."""
+
+    def __init__(self):
+        self.num_vars = 0
+        self.clauses = []
+
+    def new_var(self):
+        self.num_vars += 1
+        return self.num_vars
+
+    def add_clause(self, literals):
+        self.clauses.append(list(literals))
+
+    def add_terms(self, terms):
+        """Acrescenta a cláusula 'terms', em que alguns termos podem ser as
+        constantes True ou False: a cláusula é omitida se tiver True e os
+        False são retirados."""
+        if not any(term is True for term in terms):
+            self.add_clause(term for term in terms if term is not False)
+
+    def exactly(self, literals, k):
+        """Acrescenta as cláusulas de 'exatamente k dos literais são
+        verdadeiros', com um contador sequencial: s[i][j] é verdadeira se e
+        só se pelo menos j dos primeiros i literais o são, e só se criam
+        variáveis para os s[i][j] que não são constantes."""
+        literals = list(literals)
+        if not 0 <= k <= len(literals):
+            self.add_clause([])
+            return
+        counts = [True] + [False] * (k + 1)  # s[0][j]
+        for literal in literals:
+            counts = [True] + [self.at_least(counts[j], counts[j - 1], literal) for j in range(1, k + 2)]
+        self.add_terms([counts[k]])
+        self.add_terms([negate(counts[k + 1])])
+
+    def at_least(self, before, carry, literal):
+        """Devolve um termo equivalente a before or (carry and literal)."""
+        if before is True or carry is False:
+            return before
+        if before is False and carry is True:
+            return literal
+        counter = self.new_var()
+        for clause in ([negate(before), counter], [negate(carry), -literal, counter],
+                       [-counter, before, carry], [-counter, before, literal]):
+            self.add_terms(clause)
+        return counter
+
+    def dimacs(self, comments=()):
+        """Devolve a fórmula no formato DIMACS CNF."""
+        lines = ['c ' + comment for comment in comments]
+        lines.append('p cnf {} {}'.format(self.num_vars, len(self.clauses)))
+        lines.extend(' '.join(map(str, clause + [0])) for clause in self.clauses)
+        return '\n'.join(lines) + '\n'
+
+
+def negate(term):
+    """Negação de um literal ou de uma das constantes True e False."""
+    return not term if isinstance(term, bool) else -term
+
+
+def luby(i):
+    """i-ésimo termo (a partir de 1) da sequência de Luby 1 1 2 1 1 2 4 ..."""
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    while i != (1 << k) - 1:
+        i -= (1 << (k - 1)) - 1
+        k = 1
+        while (1 << k) - 1 < i:
+            k += 1
+    return 1 << (k - 1)
+
+
+class CDCLSolver:
+    """Solver CDCL para uma CNF. solve() devolve True ou False e, se
+    satisfazível, model() devolve o conjunto das variáveis verdadeiras."""
+
+    RESTART_BASE = 100  # Conflitos por unidade da sequência de Luby
+    DECAY = 0.95
+
+    def __init__(self, cnf):
+        size = cnf.num_vars + 1
+        self.num_vars = cnf.num_vars
+        self.value = [0] * size  # 1 verdadeira, -1 falsa, 0 por atribuir
+        self.level = [0] * size
+        self.reason = [None] * size
+        self.activity = [0.0] * size
+        self.phase = [-1] * size  # Último valor atribuído, para as decisões
+        self.watches = [[] for _ in range(2 * size)]
+        self.trail = []
+        self.trail_lim = []
+        self.qhead = 0
+        self.increment = 1.0
+        self.heap = [(0.0, var) for var in range(1, size)]
+        self.ok = True
+        self.decisions = self.conflicts = self.propagations = 0
+        self.learnts = 0
+        for clause in cnf.clauses:
+            self.add_clause(clause)
+
+    @staticmethod
+    def watch_index(literal):
+        return 2 * literal if literal > 0 else -2 * literal + 1
+
+    def literal_value(self, literal):
+        value = self.value[abs(literal)]
+        return value if literal > 0 else -value
+
+    def add_clause(self, literals):
+        """Acrescenta uma cláusula ao nível 0, já simplificada."""
+        if not self.ok:
+            return
+        clause = []
+        for literal in literals:
+            value = self.literal_value(literal)
+            if value == 1 or -literal in clause:
+                return
+            if value == 0 and literal not in clause:
+                clause.append(literal)
+        if not clause:
+            self.ok = False
+        elif len(clause) == 1:
+            self.enqueue(clause[0], None)
+            self.ok = self.propagate() is None
+        else:
+            self.watches[self.watch_index(clause[0])].append(clause)
+            self.watches[self.watch_index(clause[1])].append(clause)
+
+    def enqueue(self, literal, reason):
+        var = abs(literal)
+        self.value[var] = 1 if literal > 0 else -1
+        self.level[var] = len(self.trail_lim)
+        self.reason[var] = reason
+        self.trail.append(literal)
+
+    def propagate(self):
+        """Propaga as atribuições da fila. Devolve a cláusula em conflito ou
+        None. Cada cláusula vigia clause[0] e clause[1]; uma cláusula que
+        serve de razão tem em clause[0] o literal que implicou."""
+        value, watches, trail = self.value, self.watches, self.trail
+        while self.qhead < len(trail):
+            false_literal = -trail[self.qhead]
+            self.qhead += 1
+            self.propagations += 1
+            index = self.watch_index(false_literal)
+            watchers = watches[index]
+            kept = watches[index] = []
+            for position, clause in enumerate(watchers):
+                if clause[0] == false_literal:
+                    clause[0], clause[1] = clause[1], false_literal
+                first = clause[0]
+                first_value = value[first] if first > 0 else -value[-first]
+                if first_value == 1:
+                    kept.append(clause)
+                    continue
+                for k in range(2, len(clause)):
+                    literal = clause[k]
+                    if (value[literal] if literal > 0 else -value[-literal]) != -1:
+                        clause[1], clause[k] = literal, false_literal
+                        watches[self.watch_index(literal)].append(clause)
+                        break
+                else:
+                    kept.append(clause)
+                    if first_value == -1:
+                        kept.extend(watchers[position + 1:])
+                        self.qhead = len(trail)
+                        return clause
+                    self.enqueue(first, clause)
+        return None
+
+    def bump(self, var):
+        self.activity[var] += self.increment
+        if self.activity[var] > 1e100:
+            self.activity = [activity * 1e-100 for activity in self.activity]
+            self.increment *= 1e-100
+            self.heap = [(-self.activity[v], v) for v in range(1, self.num_vars + 1) if not self.value[v]]
+            heapq.heapify(self.heap)
+        elif not self.value[var]:
+            heapq.heappush(self.heap, (-self.activity[var], var))
+
+    def analyze(self, conflict):
+        """Devolve (cláusula aprendida, nível de retrocesso). O primeiro
+        literal da cláusula é o único do nível atual."""
+        seen = set()
+        learnt = [None]
+        current = len(self.trail_lim)
+        counter = 0
+        literal = None
+        index = len(self.trail) - 1
+        clause = conflict
+        while True:
+            for other in (clause if literal is None else clause[1:]):
+                var = abs(other)
+                if var not in seen and self.level[var] > 0:
+                    seen.add(var)
+                    self.bump(var)
+                    if self.level[var] == current:
+                        counter += 1
+                    else:
+                        learnt.append(other)
+            while abs(self.trail[index]) not in seen:
+                index -= 1
+            literal = self.trail[index]
+            index -= 1
+            clause = self.reason[abs(literal)]
+            counter -= 1
+            if counter == 0:
+                break
+        learnt[0] = -literal
+        if len(learnt) == 1:
+            return learnt, 0
+        deepest = max(range(1, len(learnt)), key=lambda i: self.level[abs(learnt[i])])
+        learnt[1], learnt[deepest] = learnt[deepest], learnt[1]
+        return learnt, self.level[abs(learnt[1])]
+
+    def backtrack(self, level):
+        if len(self.trail_lim) <= level:
+            return
+        start = self.trail_lim[level]
+        for literal in self.trail[start:]:
+            var = abs(literal)
+            self.phase[var] = self.value[var]
+            self.value[var] = 0
+            self.reason[var] = None
+            heapq.heappush(self.heap, (-self.activity[var], var))
+        del self.trail[start:]
+        del self.trail_lim[level:]
+        self.qhead = len(self.trail)
+
+    def decide(self):
+        """Escolhe a variável por atribuir com maior atividade e atribui-lhe
+        o último valor que teve. Devolve False se já estão todas
+        atribuídas."""
+        while self.heap:
+            _, var = heapq.heappop(self.heap)
+            if not self.value[var]:
+                self.decisions += 1
+                self.trail_lim.append(len(self.trail))
+                self.enqueue(var if self.phase[var] == 1 else -var, None)
+                return True
+        return False
+
+    def solve(self):
+        if not self.ok:
+            return False
+        restarts = 1
+        budget = self.RESTART_BASE * luby(restarts)
+        while True:
+            conflict = self.propagate()
+            if conflict is not None:
+                self.conflicts += 1
+                if not self.trail_lim:
+                    self.ok = False
+                    return False
+                learnt, level = self.analyze(conflict)
+                self.backtrack(level)
+                if len(learnt) == 1:
+                    self.enqueue(learnt[0], None)
+                else:
+                    self.watches[self.watch_index(learnt[0])].append(learnt)
+                    self.watches[self.watch_index(learnt[1])].append(learnt)
+                    self.learnts += 1
+                    self.enqueue(learnt[0], learnt)
+                self.increment /= self.DECAY
+                budget -= 1
+            elif budget <= 0:
+                restarts += 1
+                budget = self.RESTART_BASE * luby(restarts)
+                self.backtrack(0)
+            elif not self.decide():
+                return True
+
+    def model(self):
+        return {var for var in range(1, self.num_vars + 1) if self.value[var] == 1}
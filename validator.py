@@ -0,0 +1,160 @@
+"""Validação vetorizada de soluções de Bimaru com NumPy.
+
+As soluções são grelhas de códigos ASCII empilhadas num array (N, H, W),
+tal como impressas por Board.print_solution: '.' e 'W' água, 't', 'b',
+'l', 'r', 'm', 'c' peças de barco e as mesmas letras em maiúsculas nas
+pistas. Cada verificação é feita de uma vez para todo o lote, pelo que se
+podem validar centenas de milhares de soluções em poucos segundos.
+
+Uso:
+    $ python3 validator.py instances.txt solutions.txt
+    $ python3 validator.py instances.txt solutions.bin --binary
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+import bimaru
+
+SHIP_CODES = np.frombuffer(b'tbmlrc', dtype=np.uint8)
+CHECKS = ('filled', 'hints', 'rows', 'columns', 'diagonals', 'shapes', 'fleet')
+
+
+def solution_array(solutions):
+    """Empilha as soluções (strings como as de Board.solution_string, todas
+    do mesmo tamanho) num array (N, H, W) de códigos ASCII."""
+    solutions = list(solutions)
+    height = solutions[0].count('\n') + 1 if solutions else 0
+    data = ''.join(solutions).replace('\n', '').encode()
+    return np.frombuffer(data, dtype=np.uint8).reshape(len(solutions), height, -1)
+
+
+def instance_arrays(boards):
+    """Devolve os arrays (rows, columns, hints) das instâncias 'boards',
+    lidas e ainda por resolver: as contagens por linha (N, H) e coluna
+    (N, W) e a grelha (N, H, W) com o código ASCII de cada pista e 0 nas
+    restantes células."""
+    boards = list(boards)
+    rows = np.array([board.rows for board in boards], dtype=np.int64)
+    columns = np.array([board.columns for board in boards], dtype=np.int64)
+    hints = np.zeros((len(boards), rows.shape[1], columns.shape[1]), dtype=np.uint8)
+    for index, board in enumerate(boards):
+        for row, col, value in board.hints:
+            hints[index, row, col] = ord(value)
+    return rows, columns, hints
+
+
+def fleet_counts(ship, max_length):
+    """Conta os barcos de cada comprimento 1..max_length + 1 (o último
+    conta os barcos maiores do que max_length) nas máscaras 'ship'. Supõe
+    formas válidas: um barco começa na célula sem peça acima nem à
+    esquerda."""
+    count = len(ship)
+    padded = np.pad(ship, ((0, 0), (1, max_length + 1), (1, max_length + 1)))
+    inner = padded[:, 1:-max_length - 1, 1:-max_length - 1]
+    start = inner & ~padded[:, :-max_length - 2, 1:-max_length - 1] & ~padded[:, 1:-max_length - 1, :-max_length - 2]
+    height, width = ship.shape[1:]
+    # at_least[k]: barcos que começam em cada célula com pelo menos k + 1 peças, na vertical ou na horizontal
+    vertical, horizontal = start.copy(), start.copy()
+    at_least = [start.reshape(count, -1).sum(axis=1)]
+    for k in range(1, max_length + 1):
+        vertical &= padded[:, 1 + k:1 + k + height, 1:1 + width]
+        horizontal &= padded[:, 1:1 + height, 1 + k:1 + k + width]
+        at_least.append((vertical | horizontal).reshape(count, -1).sum(axis=1))
+    at_least.append(np.zeros(count, dtype=at_least[0].dtype))
+    return np.stack([at_least[k] - at_least[k + 1] for k in range(max_length + 1)], axis=1)
+
+
+def check_solutions(grids, rows, columns, fleet=bimaru.DEFAULT_FLEET, hints=None):
+    """Verifica o lote 'grids' (N, H, W) e devolve um dicionário com um
+    array booleano (N,) para cada verificação de CHECKS. 'rows' (H,) ou
+    (N, H) e 'columns' (W,) ou (N, W) são as peças pedidas por linha e
+    coluna; 'hints', se dado, é uma grelha (H, W) ou (N, H, W) como a de
+    instance_arrays."""
+    grids = np.asarray(grids, dtype=np.uint8)
+    count = len(grids)
+    lower = grids | 0x20  # Minúsculas: as pistas contam como as peças que são
+    ship = np.isin(lower, SHIP_CODES)
+    result = {'filled': np.isin(lower, np.frombuffer(b'.wtbmlrc', dtype=np.uint8)).reshape(count, -1).all(axis=1)}
+    if hints is None:
+        result['hints'] = np.ones(count, dtype=bool)
+    else:
+        hints = np.broadcast_to(hints, grids.shape)
+        result['hints'] = ((hints == 0) | (grids == hints)).reshape(count, -1).all(axis=1)
+    result['rows'] = (ship.sum(axis=2) == rows).all(axis=1)
+    result['columns'] = (ship.sum(axis=1) == columns).all(axis=1)
+    diagonal = (ship[:, :-1, :-1] & ship[:, 1:, 1:]) | (ship[:, :-1, 1:] & ship[:, 1:, :-1])
+    result['diagonals'] = ~diagonal.reshape(count, -1).any(axis=1)
+
+    padded = np.pad(ship, ((0, 0), (1, 1), (1, 1)))
+    up, down = padded[:, :-2, 1:-1], padded[:, 2:, 1:-1]
+    left, right = padded[:, 1:-1, :-2], padded[:, 1:-1, 2:]
+    vertical, horizontal = up | down, left | right
+    expected = {
+        b'c': ~vertical & ~horizontal,
+        b't': ~up & down & ~horizontal,
+        b'b': up & ~down & ~horizontal,
+        b'l': ~left & right & ~vertical,
+        b'r': left & ~right & ~vertical,
+        b'm': (up & down & ~horizontal) | (left & right & ~vertical),
+    }
+    shapes = np.ones(grids.shape, dtype=bool)
+    for code, valid in expected.items():
+        shapes &= (lower != code[0]) | valid
+    result['shapes'] = shapes.reshape(count, -1).all(axis=1)
+
+    counts = fleet_counts(ship, len(fleet))
+    result['fleet'] = (counts == np.array(list(fleet) + [0])).all(axis=1)
+    return result
+
+
+def valid_solutions(grids, rows, columns, fleet=bimaru.DEFAULT_FLEET, hints=None):
+    """Array booleano (N,) com as soluções de 'grids' que passam todas as
+    verificações de check_solutions."""
+    return np.logical_and.reduce(list(check_solutions(grids, rows, columns, fleet, hints).values()))
+
+
+def read_text_solutions(path):
+    """Lê as soluções de um ficheiro escrito por bimaru.py --all em texto,
+    separadas por linhas em branco."""
+    with open(path) as solutions:
+        for block in solutions.read().split('\n\n'):
+            block = block.strip('\n')
+            if block:
+                yield None if block == bimaru.NO_SOLUTION else block
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Valida as soluções de um ficheiro de instâncias de Bimaru.")
+    parser.add_argument("instances", help="ficheiro com uma ou mais instâncias")
+    parser.add_argument("solutions", help="soluções pela mesma ordem, como escritas por bimaru.py --all")
+    parser.add_argument("--binary", action="store_true", help="as soluções estão no formato binário")
+    args = parser.parse_args()
+
+    boards = list(bimaru.parse_instances(args.instances, use_mmap=True))
+    if args.binary:
+        with open(args.solutions, 'rb') as stream:
+            solutions = list(bimaru.read_solutions(stream))
+    else:
+        solutions = list(read_text_solutions(args.solutions))
+    if len(solutions) != len(boards):
+        sys.exit("{} instâncias e {} soluções".format(len(boards), len(solutions)))
+    # Agrupa por tamanho e frota, para que cada lote seja um único array
+    groups = {}
+    for index, (board, solution) in enumerate(zip(boards, solutions)):
+        if solution is not None:
+            groups.setdefault((board.height, board.width, tuple(board.ships)), []).append(index)
+    invalid = []
+    for (_, _, fleet), indices in groups.items():
+        rows, columns, hints = instance_arrays(boards[i] for i in indices)
+        checks = check_solutions(solution_array(solutions[i] for i in indices), rows, columns, fleet, hints)
+        for position, index in enumerate(indices):
+            failed = [name for name in CHECKS if not checks[name][position]]
+            if failed:
+                invalid.append(index)
+                print("instância {}: falha {}".format(index, ', '.join(failed)))
+    unsolved = sum(solution is None for solution in solutions)
+    print("{} soluções válidas, {} inválidas, {} instâncias sem solução".format(
+        len(solutions) - unsolved - len(invalid), len(invalid), unsolved))